@@ -9,72 +9,190 @@ Assumptions:
 - Payload format: 4 bytes frame_id (uint32), 2 bytes chunk_idx (uint16),
   2 bytes total_chunks (uint16), then chunk bytes.
 - End-of-stream: frame_id == 0xFFFFFFFF and total_chunks == 0xFFFF
+- Every chunk except a frame's last one carries the same number of bytes (the
+  sender's packet size minus headers); the client learns it from the stream.
 
 If your payload format differs, update parse_payload().
 """
 
+import os
 import struct
 import time
 import threading
 import collections
+import heapq
 import logging
-from typing import Optional, Callable
+from typing import Optional, Callable, List, Tuple
 
 logger = logging.getLogger("FrameHandler")
 logging.basicConfig(level=logging.INFO)
 
 END_OF_STREAM_FRAME_ID = 0xFFFFFFFF
 END_OF_STREAM_TOTAL_CHUNKS = 0xFFFF
+_HDR = struct.Struct('!IHH')
+
+REASSEMBLY_SLOTS = 1024  # power of two: frame_id & (REASSEMBLY_SLOTS - 1) picks the slot
+PLAYBACK_RT_PRIORITY = 20  # SCHED_FIFO priority for the playback thread, when permitted
+
+class _FrameSlot:
+    """Reassembly state for the one frame currently occupying a ring slot."""
+    __slots__ = ('frame_id', 'buf', 'bitmap', 'total', 'chunk', 'received', 'size', 'first_arrival')
 
-class FrameReassemblyBuffer:
     def __init__(self):
-        # for each frame_id -> dict(chunk_idx -> bytes), expected total_chunks
-        self._frames = {}  # frame_id -> {'chunks': dict, 'total': int, 'received': int, 'first_arrival': float}
+        self.frame_id = -1  # -1: slot is free
+        self.buf = None
+
+    def reset(self, frame_id: int, total_chunks: int, chunk: int):
+        self.frame_id = frame_id
+        self.buf = bytearray(total_chunks * chunk)
+        self.bitmap = bytearray((total_chunks + 7) >> 3)
+        self.total = total_chunks
+        self.chunk = chunk
+        self.received = 0
+        self.size = 0
+        self.first_arrival = time.time()
+
+    def release(self):
+        self.frame_id = -1
+        self.buf = None
+
+class FrameReassemblyBuffer:
+    def __init__(self, chunk_bytes: Optional[int] = None, num_slots: int = REASSEMBLY_SLOTS):
+        # Frames live in a ring of slots indexed by frame_id & mask rather than a dict, since
+        # frame_ids arrive roughly in order; a slot is recycled when a newer frame maps onto it.
+        # Chunk i of a frame always lands at offset i * chunk_bytes in the slot's preallocated
+        # bytearray; a bitmap records which chunks have arrived.
+        # The stride depends on the packet size the server was asked for, so unless pinned here
+        # it is taken from the length of the first non-final chunk seen.
+        self.chunk_bytes = chunk_bytes
+        self._mask = num_slots - 1
+        self._slots = [_FrameSlot() for _ in range(num_slots)]
+        # frame_ids in the order their slots were claimed, so cleanup only visits stale frames
+        self._order = collections.deque()
         self._lock = threading.Lock()
 
+    def _slot_for(self, frame_id: int) -> Optional[_FrameSlot]:
+        slot = self._slots[frame_id & self._mask]
+        return slot if slot.frame_id == frame_id else None
+
+    def _add_chunk_locked(self, frame_id: int, chunk_idx: int, total_chunks: int, data) -> Optional[_FrameSlot]:
+        """Store one chunk and return the frame's slot, or None if the chunk was discarded. Caller holds _lock."""
+        n = len(data)
+        final = chunk_idx >= total_chunks - 1
+        chunk = self.chunk_bytes
+        if not final:
+            if n != chunk:
+                if chunk is not None:
+                    logger.info("Chunk size changed from %d to %d bytes", chunk, n)
+                chunk = self.chunk_bytes = n
+        elif chunk is None:
+            if chunk_idx:
+                # a frame's last chunk with no earlier chunk to size the stride: offset unknown
+                return None
+            chunk = n
+        slot = self._slots[frame_id & self._mask]
+        if slot.frame_id != frame_id:
+            if slot.frame_id > frame_id:
+                # late chunk for a frame whose slot was already recycled
+                return None
+            slot.reset(frame_id, total_chunks, chunk)
+            self._order.append(frame_id)
+        elif total_chunks > slot.total:
+            # in case total_chunks was previously unknown or mismatched, prefer the new value if greater.
+            slot.buf.extend(bytes((total_chunks - slot.total) * slot.chunk))
+            slot.bitmap.extend(bytes(((total_chunks + 7) >> 3) - len(slot.bitmap)))
+            slot.total = total_chunks
+        if chunk_idx >= slot.total:
+            return None
+        chunk = slot.chunk
+        if n > chunk or (n != chunk and chunk_idx < slot.total - 1):
+            logger.warning("Chunk %d of frame %d is %d bytes, stride is %d; ignoring", chunk_idx, frame_id, n, chunk)
+            return None
+        bit = 1 << (chunk_idx & 7)
+        bitmap = slot.bitmap
+        if not bitmap[chunk_idx >> 3] & bit:
+            offset = chunk_idx * chunk
+            end = offset + n
+            slot.buf[offset:end] = data
+            bitmap[chunk_idx >> 3] |= bit
+            slot.received += 1
+            if chunk_idx == slot.total - 1:
+                slot.size = end
+        return slot
+
     def add_chunk(self, frame_id: int, chunk_idx: int, total_chunks: int, data: bytes):
         with self._lock:
-            if frame_id not in self._frames:
-                self._frames[frame_id] = {
-                    'chunks': {},
-                    'total': total_chunks,
-                    'received': 0,
-                    'first_arrival': time.time(),
-                }
-            entry = self._frames[frame_id]
-            # in case total_chunks was previously unknown or mismatched, prefer the new value if greater.
-            entry['total'] = max(entry['total'], total_chunks)
-            if chunk_idx not in entry['chunks']:
-                entry['chunks'][chunk_idx] = data
-                entry['received'] += 1
+            self._add_chunk_locked(frame_id, chunk_idx, total_chunks, data)
+
+    def add_and_maybe_assemble(self, frame_id: int, chunk_idx: int, total_chunks: int, data: bytes) -> Optional[bytes]:
+        """
+        add_chunk + is_complete + assemble_frame under a single lock acquisition.
+        Returns the frame bytes if this chunk completed the frame, else None.
+        """
+        with self._lock:
+            slot = self._add_chunk_locked(frame_id, chunk_idx, total_chunks, data)
+            if slot is None or slot.received < slot.total or slot.total <= 0:
+                return None
+            return self._take_frame_locked(slot)
+
+    def ingest(self, payloads) -> Tuple[List[Tuple[int, bytes]], int, bool]:
+        """
+        Parse and store a batch of raw chunk payloads under one lock acquisition.
+        Returns (completed, chunks, eos): the (frame_id, frame_bytes) pairs this batch
+        completed, how many payloads carried a header, and whether the batch ended
+        with the end-of-stream sentinel (anything after it is ignored).
+        """
+        unpack = _HDR.unpack_from
+        hdr_size = _HDR.size
+        add = self._add_chunk_locked
+        completed = []
+        chunks = 0
+        with self._lock:
+            for payload in payloads:
+                if len(payload) < hdr_size:
+                    logger.warning("Received payload too short; ignoring")
+                    continue
+                frame_id, chunk_idx, total_chunks = unpack(payload, 0)
+                chunks += 1
+                if frame_id == END_OF_STREAM_FRAME_ID and total_chunks == END_OF_STREAM_TOTAL_CHUNKS:
+                    return completed, chunks, True
+                data = memoryview(payload)[hdr_size:]
+                slot = add(frame_id, chunk_idx, total_chunks, data)
+                if slot is not None and slot.received >= slot.total > 0:
+                    completed.append((frame_id, self._take_frame_locked(slot)))
+        return completed, chunks, False
+
+    @staticmethod
+    def _take_frame_locked(slot: _FrameSlot) -> bytes:
+        # chunks are already in order; trim the unused tail of the last chunk slot
+        frame_bytes = bytes(memoryview(slot.buf)[:slot.size])
+        slot.release()
+        return frame_bytes
 
     def is_complete(self, frame_id: int) -> bool:
         with self._lock:
-            e = self._frames.get(frame_id)
-            if not e:
+            slot = self._slot_for(frame_id)
+            if slot is None:
                 return False
-            return e['received'] >= e['total'] and e['total'] > 0
+            return slot.received >= slot.total and slot.total > 0
 
     def assemble_frame(self, frame_id: int) -> Optional[bytes]:
         with self._lock:
-            e = self._frames.get(frame_id)
-            if not e:
+            slot = self._slot_for(frame_id)
+            if slot is None:
                 return None
-            if e['received'] < e['total'] or e['total'] <= 0:
+            if slot.received < slot.total or slot.total <= 0:
                 return None
-            # assemble in chunk order 0..total-1
-            chunks = [e['chunks'].get(i, b'') for i in range(e['total'])]
-            frame_bytes = b''.join(chunks)
-            # optional: delete reassembly buffer for this frame to free memory
-            del self._frames[frame_id]
-            return frame_bytes
+            return self._take_frame_locked(slot)
 
     def cleanup_older_than(self, min_frame_id: int):
-        """Remove frames with frame_id < min_frame_id"""
+        """Release frames with frame_id < min_frame_id"""
         with self._lock:
-            to_delete = [fid for fid in self._frames if fid < min_frame_id]
-            for fid in to_delete:
-                del self._frames[fid]
+            order = self._order
+            while order and order[0] < min_frame_id:
+                slot = self._slot_for(order.popleft())
+                if slot is not None:
+                    slot.release()
 
 class FrameHandler:
     def __init__(self,
@@ -87,22 +205,32 @@ class FrameHandler:
         """
         self.fps = fps
         self.frame_interval = 1.0 / fps
+        # playback scheduling runs on integer monotonic nanoseconds: no float drift over long streams
+        self.frame_interval_ns = round(1e9 / fps)
         self.buffer_capacity_frames = buffer_capacity_frames
         self.reassembly = FrameReassemblyBuffer()
         # playback buffer: maps frame_id -> frame_bytes
         self.playback_buffer = {}
+        # min-heap of buffered frame_ids, so the oldest frame can be evicted when full.
+        # Entries for frames already popped are discarded lazily.
+        self._playback_order = []
         self.playback_lock = threading.Lock()
+        # signalled whenever a frame lands in playback_buffer, EOS arrives, or playback stops
+        self._frame_ready = threading.Condition(self.playback_lock)
         self.display_callback = display_callback
 
         self.expected_frame_id = 0
+        # frames below this id can no longer arrive: one at or past the expected frame was
+        # evicted from a full buffer, so playback skips ahead instead of waiting for it
+        self._resume_frame_id = 0
         self._playback_thread = None
         self._playback_stop = threading.Event()
 
         # QoE metrics
         self.dropped_frames = 0
-        self.stall_time = 0.0
+        self.stall_time_ns = 0
         self._stalling = False
-        self._stall_start = None
+        self._stall_start_ns = None
 
         # stats
         self.received_frames_total = 0
@@ -114,106 +242,167 @@ class FrameHandler:
         Parse the bytes payload into (frame_id, chunk_idx, total_chunks, data) and add chunk.
         Header format: !IHH  (uint32, uint16, uint16)
         """
-        if len(payload) < 8:
+        if len(payload) < _HDR.size:
             logger.warning("Received payload too short; ignoring")
             return
-        frame_id, chunk_idx, total_chunks = struct.unpack('!IHH', payload[:8])
-        chunk_data = payload[8:]
+        frame_id, chunk_idx, total_chunks = _HDR.unpack_from(payload, 0)
+        # memoryview slice: the chunk is only copied once, into its frame buffer slot
+        chunk_data = memoryview(payload)[_HDR.size:]
         self.received_frames_total += 1
 
         # End of stream sentinel
         if frame_id == END_OF_STREAM_FRAME_ID and total_chunks == END_OF_STREAM_TOTAL_CHUNKS:
             logger.info("End of stream received.")
-            self.eos_received = True
+            with self._frame_ready:
+                self.eos_received = True
+                self._frame_ready.notify_all()
             return
 
-        self.reassembly.add_chunk(frame_id, chunk_idx, total_chunks, chunk_data)
+        # If this chunk completed the frame, move it to the playback buffer
+        frame_bytes = self.reassembly.add_and_maybe_assemble(frame_id, chunk_idx, total_chunks, chunk_data)
+        if frame_bytes is not None:
+            with self._frame_ready:
+                self._buffer_frame(frame_id, frame_bytes)
+                self._frame_ready.notify_all()
 
-        # If frame complete, move to playback buffer
-        if self.reassembly.is_complete(frame_id):
-            frame_bytes = self.reassembly.assemble_frame(frame_id)
-            if frame_bytes is not None:
-                with self.playback_lock:
-                    if len(self.playback_buffer) < self.buffer_capacity_frames:
-                        self.playback_buffer[frame_id] = frame_bytes
-                        self.frames_reassembled_total += 1
-                    else:
-                        # buffer full: drop oldest in buffer to make space (or drop new frame)
-                        # We'll drop the new frame (conservative) and count as dropped (playback will miss it).
-                        logger.info("Playback buffer full; dropping reassembled frame %d", frame_id)
-                        self.dropped_frames += 1
+    def parse_payloads_and_add(self, payloads):
+        """
+        Batch form of parse_payload_and_add: header parsing and reassembly for the whole
+        batch run under one reassembly lock, and finished frames are published under one
+        playback lock.
+        """
+        completed, chunks, eos = self.reassembly.ingest(payloads)
+        self.received_frames_total += chunks
+        if completed:
+            with self._frame_ready:
+                for frame_id, frame_bytes in completed:
+                    self._buffer_frame(frame_id, frame_bytes)
+                self._frame_ready.notify_all()
+        if eos:
+            logger.info("End of stream received.")
+            with self._frame_ready:
+                self.eos_received = True
+                self._frame_ready.notify_all()
+
+    def _buffer_frame(self, frame_id: int, frame_bytes: bytes):
+        """Move a reassembled frame into the playback buffer. Caller holds playback_lock."""
+        if frame_id < self.expected_frame_id:
+            # playback already moved past this frame (and counted it as dropped)
+            return
+        if len(self.playback_buffer) >= self.buffer_capacity_frames:
+            # buffer full: drop the oldest buffered frame to make space for the new one. The
+            # playback loop counts it as dropped when it reaches its id.
+            oldest = self._pop_oldest_frame()
+            logger.info("Playback buffer full; dropping buffered frame %d", oldest)
+            self._resume_frame_id = max(self._resume_frame_id, oldest + 1)
+        self.playback_buffer[frame_id] = frame_bytes
+        heapq.heappush(self._playback_order, frame_id)
+        self.frames_reassembled_total += 1
+
+    def _pop_oldest_frame(self) -> int:
+        """Evict the lowest buffered frame_id. Caller holds playback_lock."""
+        order = self._playback_order
+        while True:
+            frame_id = heapq.heappop(order)
+            if self.playback_buffer.pop(frame_id, None) is not None:
+                return frame_id
+
+    def _pop_frame(self, frame_id: int) -> Optional[bytes]:
+        """Take frame_id out of the playback buffer, if present. Caller holds playback_lock."""
+        frame = self.playback_buffer.pop(frame_id, None)
+        order = self._playback_order
+        while order and order[0] not in self.playback_buffer:
+            heapq.heappop(order)
+        return frame
 
     def start_playback(self, start_frame_id: int = 0):
         """Start playback loop in separate thread."""
         self.expected_frame_id = start_frame_id
+        self._resume_frame_id = start_frame_id
         self._playback_stop.clear()
         self._playback_thread = threading.Thread(target=self._playback_loop, daemon=True)
         self._playback_thread.start()
+        self._pin_playback_thread()
+
+    def _pin_playback_thread(self):
+        """
+        Keep the playback thread on one core and, if allowed, under SCHED_FIFO so it wakes
+        promptly at each display deadline; scheduler jitter would otherwise show up as stall
+        time. Both calls are Linux-only, and SCHED_FIFO needs CAP_SYS_NICE, so either may fail.
+        """
+        tid = self._playback_thread.native_id
+        try:
+            cores = sorted(os.sched_getaffinity(0))
+            os.sched_setaffinity(tid, {cores[-1]})
+        except (AttributeError, OSError):
+            logger.debug("Could not pin playback thread to a core")
+        try:
+            os.sched_setscheduler(tid, os.SCHED_FIFO, os.sched_param(PLAYBACK_RT_PRIORITY))
+        except (AttributeError, OSError):
+            logger.debug("SCHED_FIFO not permitted for playback thread; using default scheduling")
 
     def stop_playback(self):
         self._playback_stop.set()
+        with self._frame_ready:
+            self._frame_ready.notify_all()
         if self._playback_thread:
             self._playback_thread.join(timeout=2.0)
 
+    def _frame_or_exit_ready(self) -> bool:
+        return (self.expected_frame_id in self.playback_buffer
+                or self.expected_frame_id < self._resume_frame_id
+                or self.eos_received
+                or self._playback_stop.is_set())
+
     def _playback_loop(self):
-        next_display_time = time.time()
+        next_display_ns = time.monotonic_ns()
         while not self._playback_stop.is_set():
-            now = time.time()
-            if now < next_display_time:
-                time.sleep(min(0.01, next_display_time - now))
+            now = time.monotonic_ns()
+            if now < next_display_ns:
+                time.sleep(min(0.01, (next_display_ns - now) / 1e9))
                 continue
 
             # Attempt to fetch expected frame
             with self.playback_lock:
-                frame = self.playback_buffer.pop(self.expected_frame_id, None)
+                frame = self._pop_frame(self.expected_frame_id)
 
             if frame is None:
                 # frame missing at scheduled display time -> dropped or stall
                 # Wait briefly for small network jitter: we allow a tiny grace window (e.g., 50ms)
                 grace = min(0.05, self.frame_interval * 0.5)
-                t_wait_start = time.time()
-                waited = 0.0
-                found = False
-                while waited < grace and not self._playback_stop.is_set():
-                    with self.playback_lock:
-                        frame = self.playback_buffer.pop(self.expected_frame_id, None)
-                    if frame is not None:
-                        found = True
-                        break
-                    time.sleep(0.005)
-                    waited = time.time() - t_wait_start
+                with self._frame_ready:
+                    self._frame_ready.wait_for(self._frame_or_exit_ready, timeout=grace)
+                    frame = self._pop_frame(self.expected_frame_id)
 
-                if found:
+                if frame is not None:
                     # display found frame
                     if self._stalling:
                         # we were stalling; accumulate stall time and clear.
                         self._stalling = False
-                        self._stall_start = None
+                        self._stall_start_ns = None
+                elif self.expected_frame_id < self._resume_frame_id:
+                    # evicted from the full buffer, or missing behind a frame that was: skip it
+                    pass
                 else:
                     # Cannot find frame within grace window -> treat as stall
                     # Start stall if not already
                     if not self._stalling:
                         self._stalling = True
-                        self._stall_start = time.time()
+                        self._stall_start_ns = time.monotonic_ns()
                     # Wait until frame becomes available or EOS
-                    while not self._playback_stop.is_set():
-                        with self.playback_lock:
-                            frame = self.playback_buffer.pop(self.expected_frame_id, None)
-                        if frame is not None:
-                            # stop stall
-                            if self._stalling and self._stall_start is not None:
-                                additional = time.time() - self._stall_start
-                                self.stall_time += additional
-                                self._stalling = False
-                                self._stall_start = None
-                            break
+                    with self._frame_ready:
+                        self._frame_ready.wait_for(self._frame_or_exit_ready)
+                        frame = self._pop_frame(self.expected_frame_id)
+                    if frame is not None or self.expected_frame_id < self._resume_frame_id:
+                        # stop stall: the frame arrived, or an eviction means it never will
+                        if self._stalling and self._stall_start_ns is not None:
+                            self.stall_time_ns += time.monotonic_ns() - self._stall_start_ns
+                            self._stalling = False
+                            self._stall_start_ns = None
+                    elif self.eos_received:
                         # If EOS and no frame will come, count as dropped and move on
-                        if self.eos_received:
-                            # Consider frame dropped, increment metrics, move to next frame
-                            logger.debug("EOS reached and frame %d not available: counting as dropped", self.expected_frame_id)
-                            self.dropped_frames += 1
-                            break
-                        time.sleep(0.01)  # wait a bit for arrivals
+                        logger.debug("EOS reached and frame %d not available: counting as dropped", self.expected_frame_id)
+                        self.dropped_frames += 1
                     # after stall resolved or dropped, continue loop: if frame still None and eos -> continue
             # If we have frame now, display it
             if frame is not None:
@@ -231,7 +420,7 @@ class FrameHandler:
             # housekeeping: cleanup very old frames
             self.reassembly.cleanup_older_than(self.expected_frame_id - 10)
             # schedule next display time
-            next_display_time += self.frame_interval
+            next_display_ns += self.frame_interval_ns
 
             # if we reach EOS and playback buffer empty and expected >= last delivered, exit loop
             if self.eos_received:
@@ -239,6 +428,11 @@ class FrameHandler:
                     if len(self.playback_buffer) == 0:
                         break
 
+    @property
+    def stall_time(self) -> float:
+        """Accumulated stall time in seconds."""
+        return self.stall_time_ns / 1e9
+
     def get_metrics(self):
         return {
             'received_chunks_total': self.received_frames_total,
@@ -9,6 +9,8 @@ import logging
 import sys
 import os
 import socket
+import collections
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from queue import Queue
 import cv2
@@ -19,13 +21,16 @@ frame_queue = Queue()
 # Setup path to find 'shared' folder
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from shared.gbn_protocol import GBNReceiver
+from shared.gbn_protocol import GBNReceiver, MSG_TAG_CMD
 from frame_handler import FrameHandler
 
 logger = logging.getLogger("VideoClient")
 logging.basicConfig(level=logging.INFO)
 
-PLAY_CMD_TEMPLATE = "PLAY {}\n".encode('utf-8')
+PLAY_CMD_TEMPLATE = bytes([MSG_TAG_CMD]) + "PLAY {}\n".encode('utf-8')
+RECV_BATCH_SIZE = 32  # datagrams drained per recvmmsg syscall
+RECV_SOCKET_BUFFER_BYTES = 8 * 1024 * 1024  # holds a burst of frames while the receive loop catches up
+DECODE_WORKERS = os.cpu_count() or 1
 
 class VideoClient:
     def __init__(self,
@@ -34,9 +39,12 @@ class VideoClient:
                  fps: float = 30.0,
                  buffer_capacity_frames: int = 120,
                  start_frame_id: int = 0,
-                 display_callback: Optional[callable] = None):
+                 display_callback: Optional[callable] = None,
+                 play_options: str = ""):
         self.gbn = gbn_transport
         self.filename = filename
+        # optional PLAY arguments for the server, e.g. "640x360 q60"
+        self.play_options = play_options
         self.frame_handler = FrameHandler(fps=fps,
                                           buffer_capacity_frames=buffer_capacity_frames,
                                           display_callback=display_callback)
@@ -48,7 +56,8 @@ class VideoClient:
         # Send initial PLAY command
         logger.info("Sending PLAY request for '%s'", self.filename)
         try:
-            cmd = PLAY_CMD_TEMPLATE.replace(b'{}', self.filename.encode('utf-8'))
+            request = f"{self.filename} {self.play_options}".strip()
+            cmd = PLAY_CMD_TEMPLATE.replace(b'{}', request.encode('utf-8'))
             self.gbn.send(cmd)
         except Exception:
             logger.exception("Failed to send PLAY request")
@@ -75,21 +84,21 @@ class VideoClient:
     def receive_loop(self):
         while not self._recv_stop.is_set():
             try:
-                # GBNReceiver.recv() should block until a valid, in-order packet arrives
-                payload = self.gbn.recv()
+                # GBNReceiver.recv_batch() blocks until at least one valid, in-order packet arrives
+                payloads = self.gbn.recv_batch(RECV_BATCH_SIZE)
             except Exception:
                 logger.exception("Error receiving from GBN transport")
                 break
 
-            if not payload:
+            if payloads is None:
                 # This usually happens if connection closes
                 break
 
-            # feed to frame handler
+            # feed to frame handler; payload views are only valid until the next recv_batch()
             try:
-                self.frame_handler.parse_payload_and_add(payload)
+                self.frame_handler.parse_payloads_and_add(payloads)
             except Exception:
-                logger.exception("Failed to parse payload")
+                logger.exception("Failed to parse payloads")
 
             if self.frame_handler.eos_received:
                 logger.info("EOS observed by client; stopping receive loop")
@@ -104,20 +113,31 @@ class VideoClient:
 def example_display_callback(frame_id: int, frame_bytes: bytes):
     frame_queue.put(frame_bytes)
 
-def run_client(gbn_transport, filename: str, fps: float = 30.0):
-    client = VideoClient(gbn_transport, filename, fps=fps, display_callback=example_display_callback)
+def _decode_frame(frame_bytes: bytes):
+    # cv2.imdecode releases the GIL, so pool workers decode in parallel
+    return cv2.imdecode(np.frombuffer(frame_bytes, dtype='uint8'), cv2.IMREAD_COLOR)
+
+def run_client(gbn_transport, filename: str, fps: float = 30.0, play_options: str = ""):
+    client = VideoClient(gbn_transport, filename, fps=fps, display_callback=example_display_callback,
+                         play_options=play_options)
     client.start()
     
     # Capture Start Time for Duration/Completion calculation
     start_time = time.time()
 
+    # JPEG decode runs on the pool; this (UI) thread only calls imshow.
+    # Futures are kept in submission order so frames are shown in order.
+    decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS)
+    pending = collections.deque()
+
     try:
         while not client.frame_handler.eos_received:
-            # pull frame from queue
-            if not frame_queue.empty():
-                frame_bytes = frame_queue.get()
-                nparr = np.frombuffer(frame_bytes, dtype='uint8')
-                img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            # hand every queued frame to the decode pool
+            while not frame_queue.empty():
+                pending.append(decode_pool.submit(_decode_frame, frame_queue.get()))
+            # show whatever has finished decoding, oldest first
+            while pending and pending[0].done():
+                img = pending.popleft().result()
                 if img is not None:
                     cv2.imshow("CinePy Client", img)
                     cv2.waitKey(1)
@@ -128,6 +148,7 @@ def run_client(gbn_transport, filename: str, fps: float = 30.0):
 
     finally:
         client.stop()
+        decode_pool.shutdown(wait=False, cancel_futures=True)
         cv2.destroyAllWindows()
         
         # --- METRICS REPORT ---
@@ -146,16 +167,18 @@ def run_client(gbn_transport, filename: str, fps: float = 30.0):
 
 # --- MAIN BLOCK ---
 if __name__ == "__main__":
-    # Usage: python video_client.py <server_ip> <server_port> <filename>
+    # Usage: python video_client.py <server_ip> <server_port> <filename> [WxH] [qNN]
     server_ip = sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1"
     server_port = int(sys.argv[2]) if len(sys.argv) > 2 else 9000
     filename = sys.argv[3] if len(sys.argv) > 3 else "test_video.mp4"
+    play_options = " ".join(sys.argv[4:])
 
     print(f"Connecting to {server_ip}:{server_port} requesting {filename}")
 
     # 1. Create UDP Socket
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_SOCKET_BUFFER_BYTES)
     # 2. Wrap it in GBNReceiver (which we define in shared/gbn_protocol.py)
     transport = GBNReceiver(sock, (server_ip, server_port))
     # 3. Run
-    run_client(transport, filename)
\ No newline at end of file
+    run_client(transport, filename, play_options=play_options)
\ No newline at end of file
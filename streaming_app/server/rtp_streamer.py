@@ -3,13 +3,50 @@ import struct
 import sys
 import os
 import time
+import queue
+import threading
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from shared.gbn_protocol import HEADER_SIZE, expect_checksum_size
 from shared.loss_metrics import LossModel
+from shared.spsc_ring import SPSCRing
 
 END_OF_STREAM_FRAME_ID = 0xFFFFFFFF
 END_OF_STREAM_TOTAL_CHUNKS = 0xFFFF
+JPEG_QUALITY = 80
+_RTP_HDR = struct.Struct('!IHH')
+_EOS_PACKET = _RTP_HDR.pack(END_OF_STREAM_FRAME_ID, 0, END_OF_STREAM_TOTAL_CHUNKS)
+FRAME_QUEUE_DEPTH = 4  # power of two: encoded frames the capture stage may run ahead of the send stage
+
+# -- Optional libjpeg-turbo Encoder --
+
+try:
+    from turbojpeg import TurboJPEG, TJSAMP_420, TJPF_BGR
+except ImportError:
+    TurboJPEG = None
+
+def _load_turbojpeg():
+    if TurboJPEG is None:
+        return None
+    try:
+        return TurboJPEG()
+    except (OSError, RuntimeError):
+        # Python binding installed but the libturbojpeg shared library is missing
+        return None
+
+def _open_capture(video_path):
+    """
+    Open the video with hardware-accelerated decoding if this OpenCV build and host
+    support it (OpenCV >= 4.5 FFmpeg backend), otherwise with the default backend.
+    """
+    if hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+        cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG,
+                               [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+        if cap.isOpened():
+            return cap
+        cap.release()
+    return cv2.VideoCapture(video_path)
 
 class RTPStreamer:
     """
@@ -17,67 +54,96 @@ class RTPStreamer:
         - frame encoding
         - fragmenting frames into RTP chunks
         - pacing frames using FPS
+
+    stream_file runs as a two-stage pipeline: a capture thread reads and encodes
+    frames while the calling thread chunks, sends and paces them.
     """
     # FIX: We removed 'server_socket' from here so it matches video_server.py
-    def __init__(self, gbn_sender, max_packet_size=1400, fps=30):
+    def __init__(self, gbn_sender, max_packet_size=1400, fps=30,
+                 target_width=None, target_height=None, quality=JPEG_QUALITY):
         self.gbn = gbn_sender
         self.max_packet_size = max_packet_size
-        self.max_chunk_bytes = max_packet_size - 8
+        self.max_chunk_bytes = max_packet_size - _RTP_HDR.size
+        # every chunk but a frame's last is exactly this size, as is the GBN datagram carrying it
+        expect_checksum_size(self.max_chunk_bytes)
+        expect_checksum_size(HEADER_SIZE + max_packet_size)
         self.fps = fps
+        # Optional downscale before encoding: pixels drive both encode time and chunk count
+        self.target_width = target_width
+        self.target_height = target_height
+        self.quality = quality
         self.frame_id = 0
-        self._stop = False
+        self._stop = threading.Event()
+        self._capture_error = None
+        # one encoder per streamer: TurboJPEG handles are not shared across threads
+        self._tj = _load_turbojpeg()
         
         # Loss model is now handled by the Sender, not here.
 
     def _encode_frame(self, frame):
         # Convert raw images into JPEG bytes
-        ok, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
+        frame = self._resize_frame(frame)
+        if self._tj is not None:
+            # libjpeg-turbo's SIMD encoder; cap.read() frames are already contiguous BGR
+            return self._tj.encode(frame, quality=self.quality, jpeg_subsample=TJSAMP_420, pixel_format=TJPF_BGR)
+        ok, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
         if not ok:
             raise RuntimeError("Failed to encode frame to JPEG")
         return buf.tobytes()
 
-    def _chunk_bytes(self, data):
-        # Splitting bytes into max_chunk_bytes sized chunks
-        chunks = []
-        length = len(data)
-        for i in range(0, length, self.max_chunk_bytes):
-            chunks.append(data[i:i+self.max_chunk_bytes])
-
-        return chunks
+    def _resize_frame(self, frame):
+        # Scale to the target size; a missing dimension keeps the source aspect ratio
+        if self.target_width is None and self.target_height is None:
+            return frame
+        h, w = frame.shape[:2]
+        width = self.target_width or round(w * self.target_height / h)
+        height = self.target_height or round(h * self.target_width / w)
+        if (width, height) == (w, h):
+            return frame
+        return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
 
     def send_frame(self, frame):
         # Encode the frame, split it into RTP chunks, send frame using GBN
-        jpeg_bytes = self._encode_frame(frame)
-        chunks = self._chunk_bytes(jpeg_bytes)
-        total_chunks = len(chunks)
+        self._send_jpeg(self._encode_frame(frame))
+
+    def _send_jpeg(self, jpeg_bytes):
+        # Split an encoded frame into RTP chunks and send them using GBN
+        jpeg = memoryview(jpeg_bytes)
+        n = self.max_chunk_bytes
+        length = len(jpeg)
+        total_chunks = (length + n - 1) // n
         if total_chunks == 0:
             return
         if total_chunks > 0xFFFF:
             raise RuntimeError(f"Too many chunks: {total_chunks}")
-        # Construct and send each chunk with header
-        for chunk_idx in range(total_chunks):
-            header = struct.pack(
-                '!IHH',
-                self.frame_id,
-                chunk_idx,
-                total_chunks
-            )
-            packet = header + chunks[chunk_idx]
-            self.gbn.send_data(packet)
+        # Each chunk goes out as (header, memoryview slice of the JPEG), gathered by the
+        # kernel, so the JPEG itself is never copied in user space. The encoded bytes are
+        # immutable, so GBN can keep the slices for retransmission.
+        pack = _RTP_HDR.pack
+        packets = [(pack(self.frame_id, chunk_idx, total_chunks), jpeg[offset:offset + n])
+                   for chunk_idx, offset in enumerate(range(0, length, n))]
+        # one sendmmsg() per window's worth of chunks instead of a sendto() per chunk
+        self.gbn.send_batch(packets)
         self.frame_id += 1
 
     def send_eos(self):
         # Send end-of-stream marker so client stops playback
-        header = struct.pack('!IHH', END_OF_STREAM_FRAME_ID, 0, END_OF_STREAM_TOTAL_CHUNKS)
-        self.gbn.send_data(header)
+        self.gbn.send_data(_EOS_PACKET)
 
-    def stream_file(self, video_path, loop=False):
-        # Read frames from video file and stream to client
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            raise RuntimeError(f"Cannot open video: {video_path}")
+    def _put_frame(self, frames, item) -> bool:
+        # Blocks while the send stage is FRAME_QUEUE_DEPTH frames behind, but gives up on stop
+        while not self._stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _capture_and_encode(self, cap, frames, loop):
+        # Pipeline stage 1: read and encode frames, hand JPEG bytes to the send stage
         try:
-            while not self._stop:
+            while not self._stop.is_set():
                 ret, frame = cap.read()
                 # End of video
                 if not ret:
@@ -86,12 +152,66 @@ class RTPStreamer:
                         cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
                         continue
                     break
-                self.send_frame(frame)
+                if not self._put_frame(frames, self._encode_frame(frame)):
+                    break
+        except Exception as e:
+            self._capture_error = e
+        finally:
+            # None marks the end of the stream for the send stage
+            self._put_frame(frames, None)
+
+    def stream_file(self, video_path, loop=False):
+        # Read frames from video file and stream to client. Decoding happens in cap.read() on
+        # the capture thread; VideoCapture is not thread-safe, so grab/retrieve stay together there.
+        cap = _open_capture(video_path)
+        if not cap.isOpened():
+            raise RuntimeError(f"Cannot open video: {video_path}")
+        # exactly one capture thread puts and this thread gets, so a lock-free ring suffices
+        frames = SPSCRing(FRAME_QUEUE_DEPTH)
+        capture = threading.Thread(target=self._capture_and_encode, args=(cap, frames, loop), daemon=True)
+        capture.start()
+        try:
+            # Pipeline stage 2: chunk, send and pace; encoding of the next frame overlaps this.
+            # Frame i is due at start + i/fps, so time spent sending counts against the frame
+            # period and a late frame is followed by catch-up frames with no sleep.
+            start_ns = time.monotonic_ns()
+            sent = 0
+            while not self._stop.is_set():
+                try:
+                    jpeg = frames.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if jpeg is None:
+                    break
+                self._send_jpeg(jpeg)
+                sent += 1
                 if self.fps:
-                    time.sleep(1.0/ self.fps)
+                    delay_ns = start_ns + round(sent * 1e9 / self.fps) - time.monotonic_ns()
+                    if delay_ns > 0:
+                        time.sleep(delay_ns / 1e9)
+            if self._capture_error is not None:
+                raise self._capture_error
+        except ConnectionError as e:
+            # the sender was closed (re-PLAY, or the client stopped ACKing)
+            print(f"[RTP] Stream aborted: {e}")
+        except OSError as e:
+            # e.g. EMSGSIZE: with path MTU discovery on (DF set), a datagram larger than the
+            # path MTU is refused rather than fragmented
+            print(f"[RTP] Stream failed: {e}")
         finally:
+            # also stops the capture stage if sending failed
+            self._stop.set()
+            capture.join()
             cap.release()
-            self.send_eos()
+            try:
+                self.send_eos()
+                # keep retransmitting until the tail of the stream and the EOS marker are ACKed
+                self.gbn.wait_until_acked()
+            except OSError:
+                # closed sender (ConnectionError) or a send error already reported above
+                pass
+            # stops the sender's reactor thread; a stalled client closes it sooner
+            self.gbn.close()
             
             # --- METRICS REPORT ---
             stats = self.gbn.get_metrics()
@@ -105,5 +225,5 @@ class RTPStreamer:
             print("="*30 + "\n")
 
     def stop_stream(self):
-        # Stops streaming loop
-        self._stop = True
\ No newline at end of file
+        # Stops both pipeline stages
+        self._stop.set()
\ No newline at end of file
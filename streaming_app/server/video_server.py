@@ -1,18 +1,106 @@
 import sys
 import os
+import re
+import queue
 import socket
+import struct
 import threading
 
 # Add the parent directory to the path so we can see 'shared'
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, BASE_DIR)
 
-from shared.gbn_protocol import GBNSender, GBNUtilities
+from shared.gbn_protocol import GBNSender, HEADER_FORMAT, MSG_TAG_ACK, MSG_TAG_CMD
 from shared.loss_metrics import LossModel
 # Ensure this file exists and imports cv2 successfully now
 import rtp_streamer
 
 client_sessions = {}
+_ACK_HDR = struct.Struct(HEADER_FORMAT)
+SOCKET_BUFFER_BYTES = 8 * 1024 * 1024  # absorbs frame-sized bursts; the kernel may clamp it to net.core.*mem_max
+IP_PMTUDISC_DO = 2  # never fragment: oversized datagrams fail with EMSGSIZE instead
+ZEROCOPY_SEND = False  # MSG_ZEROCOPY sends; see README before turning this on
+
+# Control replies
+_RESP_OK_PLAY = b"200 OK PLAY"
+_RESP_OK_STOP = b"200 OK STOP"
+_RESP_BAD_REQUEST = b"400 BAD_REQUEST"
+_RESP_INTERNAL_ERROR = b"500 INTERNAL_ERROR"
+
+def tune_udp_socket(sock):
+    """
+    Enlarge the socket buffers and turn on path MTU discovery where supported. With it on,
+    a datagram larger than the path MTU fails with EMSGSIZE instead of being fragmented;
+    RTPStreamer.stream_file and the sender's retransmissions report that error.
+    """
+    for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER_BYTES)
+        except OSError as e:
+            print(f"[SERVER] Could not set socket buffer size: {e}")
+    if hasattr(socket, 'IP_MTU_DISCOVER'):
+        # Linux only
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+        except OSError as e:
+            print(f"[SERVER] Could not enable path MTU discovery: {e}")
+
+# Optional trailing PLAY arguments, e.g. "PLAY file.mp4 640x360 q60"
+_SIZE_ARG = re.compile(r'^([1-9]\d*)x([1-9]\d*)$')
+_QUALITY_ARG = re.compile(r'^q(\d{1,3})$')
+
+def parse_play_argument(argument):
+    """
+    Split a PLAY argument into (filename, streamer_options). Options are taken from the
+    end, so filenames containing spaces still work.
+    """
+    tokens = argument.split(' ')
+    options = {}
+    while len(tokens) > 1:
+        size = _SIZE_ARG.match(tokens[-1])
+        quality = _QUALITY_ARG.match(tokens[-1])
+        if size and 'target_width' not in options:
+            options['target_width'], options['target_height'] = int(size.group(1)), int(size.group(2))
+        elif quality and 'quality' not in options:
+            options['quality'] = max(1, min(100, int(quality.group(1))))
+        else:
+            break
+        tokens.pop()
+    return ' '.join(tokens).strip(), options
+
+class Session:
+    """
+    One client's state. Its thread handles the client's commands in arrival order, so
+    only that thread creates or replaces the sender/streamer. ACKs skip it: the receive
+    loop posts them straight to the sender's own reactor thread.
+    """
+    def __init__(self, server, client_addr):
+        self.server = server
+        self.client_addr = client_addr
+        self.sender = None
+        self.streamer = None
+        self.stream_thread = None
+        self.events = queue.SimpleQueue()  # command messages
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def end_stream(self):
+        """
+        Stop the current stream, if any: stop its pipeline, close its sender (which wakes a
+        send blocked on the window and stops the reactor thread) and wait for its thread.
+        """
+        if self.streamer:
+            self.streamer.stop_stream()
+            self.sender.close()
+            self.stream_thread.join()
+
+    def _run(self):
+        while True:
+            message = self.events.get()
+            try:
+                self.server.handle_client(message, self)
+            except Exception as e:
+                print(f"[SERVER] Session {self.client_addr} error: {e}")
 
 class VideoServer:
     def __init__(self, host='0.0.0.0', port=9000):
@@ -20,40 +108,52 @@ class VideoServer:
         self.port = port
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.server_socket.bind((self.host, self.port))
+        tune_udp_socket(self.server_socket)
+        # every datagram (mostly ACKs, one per data packet) is received into this one buffer
+        self._recv_buf = bytearray(2048)
         print(f"[SERVER] Server running on {self.host}:{self.port}")
 
     def start(self):
         print("[SERVER] Waiting for client command...")
+        buf = self._recv_buf
         while True:
             try:
                 # Receive data
-                data, client_addr = self.server_socket.recvfrom(2048)
-                
+                nbytes, client_addr = self.server_socket.recvfrom_into(buf)
+                if nbytes == 0:
+                    continue
+                tag = buf[0]
+
+                # Only this thread adds sessions; each session's own thread handles its commands
+                session = client_sessions.get(client_addr)
+
                 # 1. Text Command (PLAY/STOP)
-                if data.startswith(b"PLAY") or data.startswith(b"STOP"):
-                    message = data.decode('utf-8')
+                if tag == MSG_TAG_CMD:
+                    message = buf[1:nbytes].decode('utf-8')
                     print(f"[SERVER] Command from {client_addr}: {message}")
-                    threading.Thread(target=self.handle_client, args=(message, client_addr), daemon=True).start()
+                    if session is None:
+                        session = client_sessions[client_addr] = Session(self, client_addr)
+                    session.events.put(message)
 
                 # 2. Binary ACK (GBN Protocol)
-                else:
+                elif tag == MSG_TAG_ACK and nbytes >= 1 + _ACK_HDR.size:
                     # --- FIX: PROMISCUOUS MODE ---
-                    # We bypass the strict 'client_addr' check.
-                    # If we have ANY active session, we assume the ACK belongs to it.
-                    if len(client_sessions) > 0:
-                        # Get the first available session
-                        session = list(client_sessions.values())[0]
-                        
-                        if session["sender"]:
-                            seq_num, checksum, _ = GBNUtilities.parse_header(data)
-                            if seq_num is not None:
-                                session["sender"].process_ack(seq_num)
+                    # An ACK from an address without a session is assumed to belong to
+                    # the first session.
+                    if session is None and client_sessions:
+                        session = next(iter(client_sessions.values()))
+                    sender = session.sender if session is not None else None
+                    if sender is not None:
+                        seq_num, checksum = _ACK_HDR.unpack_from(buf, 1)
+                        sender.post_ack(seq_num)
                     # -----------------------------
 
             except Exception as e:
                 print(f"[SERVER] Error: {e}")
 
-    def handle_client(self, message, client_addr):
+    def handle_client(self, message, session):
+        # Runs on the session's thread
+        client_addr = session.client_addr
         parts = message.split(maxsplit=1)
         command = parts[0]
         
@@ -63,17 +163,8 @@ class VideoServer:
         else:
             argument = ""
         
-        # Create session entry for new clients if needed
-        if client_addr not in client_sessions:
-            client_sessions[client_addr] = {
-                "streamer": None,
-                "sender": None 
-            }
-            
-        session = client_sessions[client_addr]
-        
         if command == "PLAY":
-            filename = argument.strip()
+            filename, options = parse_play_argument(argument.strip())
             
             try:
                 # ==========================================================
@@ -94,36 +185,39 @@ class VideoServer:
                 # )
                 # ==========================================================
 
+                # a new PLAY replaces the previous stream
+                session.end_stream()
+
                 # 1. Create GBNSender with the selected loss profile
-                sender = GBNSender(self.server_socket, client_addr, loss_model=loss_profile)
-                
-                session["sender"] = sender
+                sender = GBNSender(self.server_socket, client_addr, loss_model=loss_profile,
+                                   zerocopy=ZEROCOPY_SEND)
+                session.sender = sender
                 
                 # 2. Pass sender to streamer
                 # CRITICAL FIX: Removed self.server_socket from arguments here!
-                streamer = rtp_streamer.RTPStreamer(sender)
-                session["streamer"] = streamer
+                streamer = rtp_streamer.RTPStreamer(sender, **options)
+                session.streamer = streamer
                 
                 # Stream video in background thread
-                threading.Thread(
+                session.stream_thread = threading.Thread(
                     target=streamer.stream_file,
                     args=(filename,),
                     daemon=True
-                ).start()
+                )
+                session.stream_thread.start()
                 
                 # Acknowledge the command
-                self.server_socket.sendto(b"200 OK PLAY", client_addr)
+                self.server_socket.sendto(_RESP_OK_PLAY, client_addr)
             
             except Exception as e:
                 print(f"[SERVER] Play Error: {e}")
-                self.server_socket.sendto(b"500 INTERNAL_ERROR", client_addr)
+                self.server_socket.sendto(_RESP_INTERNAL_ERROR, client_addr)
         
         elif command == "STOP":
-            if session["streamer"]:
-                session["streamer"].stop_stream() 
-            self.server_socket.sendto(b"200 OK STOP", client_addr)
+            session.end_stream()
+            self.server_socket.sendto(_RESP_OK_STOP, client_addr)
         else:
-            self.server_socket.sendto(b"400 BAD_REQUEST", client_addr)
+            self.server_socket.sendto(_RESP_BAD_REQUEST, client_addr)
 
 if __name__ == "__main__":
     # Allow running this file directly
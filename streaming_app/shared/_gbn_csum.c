@@ -0,0 +1,386 @@
+/*
+ * Native Internet checksum (RFC 1071) for shared/gbn_protocol.py.
+ *
+ * Build (optional, loaded through ctypes when present):
+ *   gcc -O3 -shared -fPIC -o _gbn_csum.so _gbn_csum.c
+ *
+ * Every inet_csum_*() entry point returns exactly what
+ * GBNUtilities.compute_checksum returns: the complemented ones'-complement
+ * sum of big-endian 16-bit words, with an odd trailing byte padded by a zero
+ * low byte. gbn_protocol.py picks one of them at import time from the CPU
+ * flags (avx512bw > avx2 > sse2 > scalar).
+ *
+ * inet_csum2() checksums two buffers as if they were one contiguous buffer,
+ * so a header and its payload need not be joined first.
+ *
+ * The same file also builds as a CPython extension module, which skips the
+ * per-call ctypes argument conversion and is preferred when present:
+ *   gcc -O3 -shared -fPIC -DGBN_PYTHON_MODULE $(python3-config --includes) \
+ *       -o _gbn_csum_ext$(python3-config --extension-suffix) _gbn_csum.c
+ */
+
+#ifdef GBN_PYTHON_MODULE
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#endif
+
+#include <stddef.h>
+#include <stdint.h>
+#include <string.h>
+
+#if defined(__x86_64__) || defined(__i386__)
+#include <immintrin.h>
+#define GBN_X86 1
+#endif
+
+/* Lane sums stay below 2^32 for this many 64-byte blocks, even after the
+ * horizontal reduction of the accumulators. */
+#define MAX_RUN_BLOCKS 2048
+
+/* Buffers at least this long are split into two load streams. */
+#define DUAL_STREAM_MIN_BYTES 512
+
+/* Prefetch distance in cache lines ahead of the load pointer. */
+#define PREFETCH_LINES 6
+
+static uint16_t fold(uint64_t sum)
+{
+    while (sum >> 16)
+        sum = (sum & 0xFFFF) + (sum >> 16);
+    return (uint16_t)sum;
+}
+
+static uint16_t swap16(uint16_t v)
+{
+    return (uint16_t)((v << 8) | (v >> 8));
+}
+
+/* Big-endian word sum, odd tail padded with a zero low byte. */
+static uint64_t sum_scalar(const uint8_t *p, size_t n)
+{
+    uint64_t sum = 0;
+    for (; n >= 2; p += 2, n -= 2)
+        sum += ((uint32_t)p[0] << 8) | p[1];
+    if (n)
+        sum += (uint32_t)p[0] << 8;
+    return sum;
+}
+
+/* 64-bit add with the carry wrapped back into bit 0. */
+static inline uint64_t add_carry(uint64_t sum, uint64_t w)
+{
+    sum += w;
+    return sum + (sum < w);
+}
+
+/*
+ * Native-order sum of n bytes (a multiple of 8), eight bytes per add with
+ * the carry wrapped back in. Four independent loads per iteration.
+ */
+static uint64_t sum_native64(const uint8_t *p, size_t n)
+{
+    uint64_t sum = 0, w[4];
+
+    for (; n >= 32; p += 32, n -= 32) {
+        memcpy(w, p, sizeof(w));
+        sum = add_carry(sum, w[0]);
+        sum = add_carry(sum, w[1]);
+        sum = add_carry(sum, w[2]);
+        sum = add_carry(sum, w[3]);
+    }
+    for (; n; p += 8, n -= 8) {
+        memcpy(w, p, 8);
+        sum = add_carry(sum, w[0]);
+    }
+    sum = (sum & 0xFFFFFFFF) + (sum >> 32);
+    return (sum & 0xFFFFFFFF) + (sum >> 32);
+}
+
+/* Big-endian word sum of the whole buffer, through the 64-bit loop. */
+static uint64_t sum_be64(const uint8_t *p, size_t n)
+{
+    size_t body = n & ~(size_t)7;
+    uint16_t s = fold(sum_native64(p, body));
+
+#if __BYTE_ORDER__ == __ORDER_LITTLE_ENDIAN__
+    s = swap16(s);
+#endif
+    return s + sum_scalar(p + body, n - body);
+}
+
+#ifdef GBN_X86
+/*
+ * The AVX2 kernels sum 64-byte blocks as little-endian words. The
+ * ones'-complement sum is byte-order independent, so the caller byte-swaps
+ * the folded result instead of shuffling every vector.
+ *
+ * unpacklo/unpackhi widen within each 128-bit lane, so nothing crosses lanes
+ * inside the loops; the single cross-lane extract happens once per run.
+ */
+__attribute__((target("avx2")))
+static inline void add_block(__m256i *lo, __m256i *hi, const uint8_t *p)
+{
+    const __m256i zero = _mm256_setzero_si256();
+    __m256i v0 = _mm256_loadu_si256((const __m256i *)p);
+    __m256i v1 = _mm256_loadu_si256((const __m256i *)(p + 32));
+
+    *lo = _mm256_add_epi32(*lo, _mm256_unpacklo_epi16(v0, zero));
+    *hi = _mm256_add_epi32(*hi, _mm256_unpackhi_epi16(v0, zero));
+    *lo = _mm256_add_epi32(*lo, _mm256_unpacklo_epi16(v1, zero));
+    *hi = _mm256_add_epi32(*hi, _mm256_unpackhi_epi16(v1, zero));
+}
+
+__attribute__((target("avx2")))
+static inline uint32_t reduce_epi32(__m256i acc)
+{
+    __m128i s = _mm_add_epi32(_mm256_castsi256_si128(acc), _mm256_extracti128_si256(acc, 1));
+    s = _mm_hadd_epi32(s, s);
+    s = _mm_hadd_epi32(s, s);
+    return (uint32_t)_mm_cvtsi128_si32(s);
+}
+
+__attribute__((target("avx2")))
+static uint64_t sum_avx2_le(const uint8_t *p, size_t blocks)
+{
+    uint64_t total = 0;
+
+    while (blocks) {
+        size_t run = blocks < MAX_RUN_BLOCKS ? blocks : MAX_RUN_BLOCKS;
+        __m256i acc0 = _mm256_setzero_si256(), acc1 = _mm256_setzero_si256();
+
+        blocks -= run;
+        for (; run; run--, p += 64) {
+            _mm_prefetch((const char *)(p + PREFETCH_LINES * 64), _MM_HINT_T0);
+            add_block(&acc0, &acc1, p);
+        }
+        total += reduce_epi32(_mm256_add_epi32(acc0, acc1));
+    }
+    return total;
+}
+
+/*
+ * Two independent load streams over the two halves of the buffer, each with
+ * its own accumulator pair, so consecutive adds do not wait on each other.
+ */
+__attribute__((target("avx2")))
+static uint64_t sum_avx2_le_dual(const uint8_t *p, size_t blocks)
+{
+    size_t half = blocks / 2;
+    const uint8_t *q = p + half * 64;
+    uint64_t total = 0;
+
+    while (half) {
+        size_t run = half < MAX_RUN_BLOCKS / 2 ? half : MAX_RUN_BLOCKS / 2;
+        __m256i acc00 = _mm256_setzero_si256(), acc01 = _mm256_setzero_si256();
+        __m256i acc10 = _mm256_setzero_si256(), acc11 = _mm256_setzero_si256();
+
+        half -= run;
+        for (; run; run--, p += 64, q += 64) {
+            _mm_prefetch((const char *)(p + PREFETCH_LINES * 64), _MM_HINT_T0);
+            _mm_prefetch((const char *)(q + PREFETCH_LINES * 64), _MM_HINT_T0);
+            add_block(&acc00, &acc01, p);
+            add_block(&acc10, &acc11, q);
+        }
+        acc00 = _mm256_add_epi32(acc00, acc01);
+        acc10 = _mm256_add_epi32(acc10, acc11);
+        total += reduce_epi32(_mm256_add_epi32(acc00, acc10));
+    }
+    /* q now sits at the end of the second half; an odd block remains there */
+    if (blocks & 1)
+        total += sum_avx2_le(q, 1);
+    return total;
+}
+
+__attribute__((target("sse2")))
+static uint64_t sum_sse2_le(const uint8_t *p, size_t blocks)
+{
+    const __m128i zero = _mm_setzero_si128();
+    uint64_t total = 0;
+
+    while (blocks) {
+        size_t run = blocks < MAX_RUN_BLOCKS ? blocks : MAX_RUN_BLOCKS;
+        __m128i acc0 = zero, acc1 = zero;
+
+        blocks -= run;
+        for (; run; run--, p += 64) {
+            for (int i = 0; i < 64; i += 16) {
+                __m128i v = _mm_loadu_si128((const __m128i *)(p + i));
+                acc0 = _mm_add_epi32(acc0, _mm_unpacklo_epi16(v, zero));
+                acc1 = _mm_add_epi32(acc1, _mm_unpackhi_epi16(v, zero));
+            }
+        }
+        acc0 = _mm_add_epi32(acc0, acc1);
+        acc0 = _mm_add_epi32(acc0, _mm_shuffle_epi32(acc0, 0x4E));
+        acc0 = _mm_add_epi32(acc0, _mm_shuffle_epi32(acc0, 0xB1));
+        total += (uint32_t)_mm_cvtsi128_si32(acc0);
+    }
+    return total;
+}
+
+/*
+ * Sums the whole buffer, tail included: the last partial block is read with
+ * a zero-filling masked load, which pads an odd byte exactly like the scalar
+ * path does once the little-endian sum is swapped back.
+ */
+__attribute__((target("avx512f,avx512bw")))
+static uint64_t sum_avx512_le(const uint8_t *p, size_t n)
+{
+    const __m512i zero = _mm512_setzero_si512();
+    __m512i total = zero;
+    size_t blocks = n / 64, rem = n % 64;
+
+    while (blocks) {
+        size_t run = blocks < MAX_RUN_BLOCKS ? blocks : MAX_RUN_BLOCKS;
+        __m512i acc = zero;
+
+        blocks -= run;
+        for (; run; run--, p += 64) {
+            __m512i v = _mm512_loadu_si512((const void *)p);
+            acc = _mm512_add_epi32(acc, _mm512_unpacklo_epi16(v, zero));
+            acc = _mm512_add_epi32(acc, _mm512_unpackhi_epi16(v, zero));
+        }
+        total = _mm512_add_epi64(total, _mm512_cvtepu32_epi64(_mm512_castsi512_si256(acc)));
+        total = _mm512_add_epi64(total, _mm512_cvtepu32_epi64(_mm512_extracti64x4_epi64(acc, 1)));
+    }
+    if (rem) {
+        __m512i v = _mm512_maskz_loadu_epi8(((__mmask64)1 << rem) - 1, (const void *)p);
+        __m512i acc = _mm512_add_epi32(_mm512_unpacklo_epi16(v, zero), _mm512_unpackhi_epi16(v, zero));
+        total = _mm512_add_epi64(total, _mm512_cvtepu32_epi64(_mm512_castsi512_si256(acc)));
+        total = _mm512_add_epi64(total, _mm512_cvtepu32_epi64(_mm512_extracti64x4_epi64(acc, 1)));
+    }
+    return (uint64_t)_mm512_reduce_add_epi64(total);
+}
+#endif
+
+uint16_t inet_csum_scalar(const uint8_t *data, size_t n)
+{
+    return (uint16_t)~fold(sum_be64(data, n));
+}
+
+/*
+ * Checksum of a followed by b. When a has odd length every byte of b lands
+ * in the other half of its word, which swaps the bytes of b's folded sum.
+ */
+uint16_t inet_csum2(const uint8_t *a, size_t na, const uint8_t *b, size_t nb)
+{
+    uint16_t sb = fold(sum_be64(b, nb));
+
+    if (na & 1)
+        sb = swap16(sb);
+    return (uint16_t)~fold(sum_be64(a, na) + sb);
+}
+
+#ifdef GBN_X86
+/* Combines a little-endian vector sum with the big-endian sum of the tail. */
+static uint16_t finish(uint64_t le_sum, const uint8_t *tail, size_t n)
+{
+    uint64_t sum = swap16(fold(le_sum)) + sum_scalar(tail, n);
+    return (uint16_t)~fold(sum);
+}
+
+uint16_t inet_csum_sse2(const uint8_t *data, size_t n)
+{
+    size_t blocks = n / 64;
+    return finish(sum_sse2_le(data, blocks), data + blocks * 64, n - blocks * 64);
+}
+
+uint16_t inet_csum_avx2(const uint8_t *data, size_t n)
+{
+    size_t blocks = n / 64;
+    uint64_t le_sum = n >= DUAL_STREAM_MIN_BYTES ? sum_avx2_le_dual(data, blocks)
+                                                 : sum_avx2_le(data, blocks);
+    return finish(le_sum, data + blocks * 64, n - blocks * 64);
+}
+
+uint16_t inet_csum_avx512(const uint8_t *data, size_t n)
+{
+    return finish(sum_avx512_le(data, n), data + n, 0);
+}
+#endif
+
+#ifdef GBN_PYTHON_MODULE
+/*
+ * Buffers at least this long are checksummed with the GIL released. A release
+ * costs the caller ~40 ns, but it is what lets a thread waiting for the GIL
+ * (a decode worker back from cv2.imdecode) in between packets: with the GIL
+ * held across 1404-byte checksums that thread waited the full 5 ms switch
+ * interval, with it released ~60 us. 1 KiB covers every data datagram while
+ * ACK-sized buffers keep the cheaper path.
+ */
+#define NOGIL_MIN_BYTES 1024
+
+typedef uint16_t (*csum_fn)(const uint8_t *, size_t);
+
+static csum_fn py_csum = inet_csum_scalar;
+
+static uint16_t csum_view(const Py_buffer *view)
+{
+    uint16_t c;
+
+    if (view->len < NOGIL_MIN_BYTES)
+        return py_csum(view->buf, (size_t)view->len);
+    Py_BEGIN_ALLOW_THREADS
+    c = py_csum(view->buf, (size_t)view->len);
+    Py_END_ALLOW_THREADS
+    return c;
+}
+
+static PyObject *py_checksum(PyObject *self, PyObject *arg)
+{
+    Py_buffer view;
+    uint16_t c;
+
+    if (PyObject_GetBuffer(arg, &view, PyBUF_SIMPLE) < 0)
+        return NULL;
+    c = csum_view(&view);
+    PyBuffer_Release(&view);
+    return PyLong_FromLong(c);
+}
+
+static PyObject *py_checksum2(PyObject *self, PyObject *const *args, Py_ssize_t nargs)
+{
+    Py_buffer a, b;
+    uint16_t c;
+
+    if (nargs != 2) {
+        PyErr_SetString(PyExc_TypeError, "checksum2() takes exactly 2 arguments");
+        return NULL;
+    }
+    if (PyObject_GetBuffer(args[0], &a, PyBUF_SIMPLE) < 0)
+        return NULL;
+    if (PyObject_GetBuffer(args[1], &b, PyBUF_SIMPLE) < 0) {
+        PyBuffer_Release(&a);
+        return NULL;
+    }
+    c = inet_csum2(a.buf, (size_t)a.len, b.buf, (size_t)b.len);
+    PyBuffer_Release(&b);
+    PyBuffer_Release(&a);
+    return PyLong_FromLong(c);
+}
+
+static PyMethodDef gbn_csum_methods[] = {
+    {"checksum", py_checksum, METH_O, "checksum(buffer) -> int: complemented RFC 1071 checksum"},
+    {"checksum2", (PyCFunction)(void (*)(void))py_checksum2, METH_FASTCALL,
+     "checksum2(a, b) -> int: checksum of a followed by b"},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef gbn_csum_module = {
+    PyModuleDef_HEAD_INIT, "_gbn_csum_ext", NULL, -1, gbn_csum_methods
+};
+
+PyMODINIT_FUNC PyInit__gbn_csum_ext(void)
+{
+#ifdef GBN_X86
+    /* Same preference order as gbn_protocol._load_native_checksum() */
+    __builtin_cpu_init();
+    if (__builtin_cpu_supports("avx512bw"))
+        py_csum = inet_csum_avx512;
+    else if (__builtin_cpu_supports("avx2"))
+        py_csum = inet_csum_avx2;
+    else if (__builtin_cpu_supports("sse2"))
+        py_csum = inet_csum_sse2;
+#endif
+    return PyModule_Create(&gbn_csum_module);
+}
+#endif
@@ -0,0 +1,267 @@
+"""
+Batched UDP I/O through the Linux recvmmsg(2) and sendmmsg(2) syscalls, which
+the socket module does not expose. Loaded through ctypes; `AVAILABLE` /
+`SEND_AVAILABLE` are False on platforms without them and callers fall back to
+one recvfrom() / sendto() per datagram.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import select
+import socket
+import struct
+
+import numpy as np
+
+MSG_WAITFORONE = 0x10000  # block for the first datagram only, then take what is queued
+_SOCKADDR_SIZE = 128  # sizeof(struct sockaddr_storage)
+MAX_IOV = 4  # buffers one BatchSender message may be gathered from
+_SA_FAMILY = struct.Struct('=H')  # sa_family is host byte order
+_SA_PORT = struct.Struct('!H')
+_SA6_PORT_FLOWINFO = struct.Struct('!HI')
+_SA6_SCOPE_ID = struct.Struct('=I')  # sin6_scope_id is host byte order
+SO_ZEROCOPY = getattr(socket, 'SO_ZEROCOPY', 60)  # Linux >= 4.14 (UDP since 5.0)
+MSG_ZEROCOPY = getattr(socket, 'MSG_ZEROCOPY', 0x4000000)
+MSG_ERRQUEUE = getattr(socket, 'MSG_ERRQUEUE', 0x2000)
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0x40)
+_ERRQUEUE_CONTROL_SIZE = 256  # room for one coalesced completion notification
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(_IOVec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+def _load_libc():
+    try:
+        return ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except (OSError, TypeError):
+        return None
+
+def _load_mmsg_call(libc, name, *extra_argtypes):
+    fn = getattr(libc, name, None) if libc is not None else None
+    if fn is not None:
+        fn.argtypes = (ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int) + extra_argtypes
+        fn.restype = ctypes.c_int
+    return fn
+
+_libc = _load_libc()
+_recvmmsg = _load_mmsg_call(_libc, 'recvmmsg', ctypes.c_void_p)
+_sendmmsg = _load_mmsg_call(_libc, 'sendmmsg')
+AVAILABLE = _recvmmsg is not None
+SEND_AVAILABLE = _sendmmsg is not None
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')  # missing on Windows
+
+_recvmsg = getattr(_libc, 'recvmsg', None) if _libc is not None else None
+if _recvmsg is not None:
+    _recvmsg.argtypes = (ctypes.c_int, ctypes.POINTER(_MsgHdr), ctypes.c_int)
+    _recvmsg.restype = ctypes.c_ssize_t
+
+
+def send_one(sock, packet, addr):
+    """Send one datagram; a tuple of buffers is gathered by sendmsg() where the platform has it."""
+    if type(packet) is not tuple:
+        sock.sendto(packet, addr)
+    elif HAS_SENDMSG:
+        sock.sendmsg(packet, (), 0, addr)
+    else:
+        sock.sendto(b''.join(packet), addr)
+
+
+def _decode_sockaddr(raw: bytes):
+    family = _SA_FAMILY.unpack_from(raw, 0)[0]
+    port = _SA_PORT.unpack_from(raw, 2)[0]
+    if family == socket.AF_INET:
+        return socket.inet_ntop(socket.AF_INET, raw[4:8]), port
+    if family == socket.AF_INET6:
+        return socket.inet_ntop(socket.AF_INET6, raw[8:24]), port
+    return None
+
+
+def _encode_sockaddr(addr):
+    """Raw sockaddr for a numeric (host, port) address, or None if it is not one."""
+    host, port = addr[0], addr[1]
+    try:
+        packed = socket.inet_pton(socket.AF_INET, host)
+        return _SA_FAMILY.pack(socket.AF_INET) + _SA_PORT.pack(port) + packed + bytes(8)
+    except OSError:
+        pass
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, host)
+    except OSError:
+        return None
+    flowinfo = addr[2] if len(addr) > 2 else 0
+    scope_id = addr[3] if len(addr) > 3 else 0
+    return (_SA_FAMILY.pack(socket.AF_INET6) + _SA6_PORT_FLOWINFO.pack(port, flowinfo)
+            + packed + _SA6_SCOPE_ID.pack(scope_id))
+
+
+def _address_of(buf) -> int:
+    if type(buf) is bytes:
+        return ctypes.cast(ctypes.c_char_p(buf), ctypes.c_void_p).value
+    # memoryviews (possibly read-only) and other buffers: numpy reports the address without copying
+    return np.frombuffer(buf, dtype=np.uint8).ctypes.data
+
+
+class BatchSender:
+    """
+    Sends a list of datagrams to one address with as few sendmmsg() calls as
+    the kernel allows. Header arrays are allocated once and reused.
+
+    A datagram is either one bytes-like object or a tuple of up to MAX_IOV of
+    them, which the kernel gathers into a single datagram.
+
+    With zerocopy=True the socket is switched to SO_ZEROCOPY and datagrams are
+    sent with MSG_ZEROCOPY: the kernel pins the buffers instead of copying
+    them, so they must stay unchanged until the datagram has left the host.
+    Completion notifications are not tracked; they are discarded whenever
+    they fill the socket's error queue; a batch the kernel still refuses after
+    that is sent by copying. `zerocopy` reads False if the kernel refused it.
+    """
+
+    def __init__(self, sock: socket.socket, max_packets: int = 64, zerocopy: bool = False):
+        self.sock = sock
+        self.max_packets = max_packets
+        self._iovs = (_IOVec * (max_packets * MAX_IOV))()
+        self._msgs = (_MMsgHdr * max_packets)()
+        for i in range(max_packets):
+            self._msgs[i].msg_hdr.msg_iov = ctypes.pointer(self._iovs[i * MAX_IOV])
+        self._addr = None
+        self._name = None
+        self._flags = 0
+        if zerocopy and _recvmsg is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_ZEROCOPY, 1)
+                self._flags = MSG_ZEROCOPY
+            except OSError:
+                pass
+        self._errq_control = ctypes.create_string_buffer(_ERRQUEUE_CONTROL_SIZE)
+        self._errq_hdr = _MsgHdr()
+
+    @property
+    def zerocopy(self) -> bool:
+        return self._flags != 0
+
+    def _drain_errqueue(self):
+        """Discard every queued MSG_ZEROCOPY completion notification without blocking."""
+        hdr, fd = self._errq_hdr, self.sock.fileno()
+        while True:
+            hdr.msg_control = ctypes.addressof(self._errq_control)
+            hdr.msg_controllen = _ERRQUEUE_CONTROL_SIZE
+            if _recvmsg(fd, ctypes.byref(hdr), MSG_ERRQUEUE | MSG_DONTWAIT) < 0:
+                return
+
+    def send(self, packets, addr):
+        """Sends every packet to addr, or raises OSError."""
+        if addr != self._addr:
+            raw = _encode_sockaddr(addr)
+            if raw is None:
+                # not a numeric address; let the socket module resolve it
+                for packet in packets:
+                    send_one(self.sock, packet, addr)
+                return
+            self._name = ctypes.create_string_buffer(raw, len(raw))
+            self._addr = addr
+        name, namelen = ctypes.addressof(self._name), len(self._name)
+        fd = self.sock.fileno()
+        for start in range(0, len(packets), self.max_packets):
+            batch = packets[start:start + self.max_packets]
+            # the iovecs borrow each buffer's memory; `batch` keeps them alive
+            for i, packet in enumerate(batch):
+                parts = packet if type(packet) is tuple else (packet,)
+                if len(parts) > MAX_IOV:
+                    raise ValueError(f"datagram gathered from more than {MAX_IOV} buffers")
+                for j, part in enumerate(parts):
+                    iov = self._iovs[i * MAX_IOV + j]
+                    iov.iov_base = _address_of(part)
+                    iov.iov_len = len(part)
+                hdr = self._msgs[i].msg_hdr
+                hdr.msg_iovlen = len(parts)
+                hdr.msg_name = name
+                hdr.msg_namelen = namelen
+            sent = 0
+            flags = self._flags
+            drained = False
+            while sent < len(batch):
+                n = _sendmmsg(fd, ctypes.byref(self._msgs[sent]), len(batch) - sent, flags)
+                if n < 0:
+                    err = ctypes.get_errno()
+                    if err == errno.EINTR:
+                        continue
+                    if err == errno.ENOBUFS and flags:
+                        # unread completion notifications have used up the socket's option memory;
+                        # if draining them once does not help, copy the rest of this batch
+                        if drained:
+                            flags = 0
+                        else:
+                            self._drain_errqueue()
+                            drained = True
+                        continue
+                    if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        # socket has a timeout (non-blocking fd) and the send buffer is full
+                        select.select([], [self.sock], [])
+                        continue
+                    raise OSError(err, 'sendmmsg failed')
+                sent += n
+
+
+class BatchReceiver:
+    """
+    Receives up to `max_packets` datagrams per syscall into buffers that are
+    allocated once and reused. Returned memoryviews are only valid until the
+    next call to recv().
+    """
+
+    def __init__(self, sock: socket.socket, max_packets: int = 32, buf_size: int = 2048):
+        self.sock = sock
+        self.max_packets = max_packets
+        self._bufs = [bytearray(buf_size) for _ in range(max_packets)]
+        self._views = [memoryview(b) for b in self._bufs]
+        self._names = [ctypes.create_string_buffer(_SOCKADDR_SIZE) for _ in range(max_packets)]
+        self._iovs = (_IOVec * max_packets)()
+        self._msgs = (_MMsgHdr * max_packets)()
+        for i, buf in enumerate(self._bufs):
+            self._iovs[i].iov_base = ctypes.addressof(ctypes.c_char.from_buffer(buf))
+            self._iovs[i].iov_len = buf_size
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._names[i])
+            hdr.msg_iov = ctypes.pointer(self._iovs[i])
+            hdr.msg_iovlen = 1
+
+    def recv(self):
+        """
+        Returns a list of (memoryview, addr), an empty list if the socket
+        timeout expired first, or raises OSError.
+        """
+        timeout = self.sock.gettimeout()
+        if timeout is not None:
+            # A socket with a timeout is non-blocking at the fd level, so wait here instead
+            ready, _, _ = select.select([self.sock], [], [], timeout)
+            if not ready:
+                return []
+        for i in range(self.max_packets):
+            self._msgs[i].msg_hdr.msg_namelen = _SOCKADDR_SIZE
+        n = _recvmmsg(self.sock.fileno(), self._msgs, self.max_packets, MSG_WAITFORONE, None)
+        if n < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(err, 'recvmmsg failed')
+        return [(self._views[i][:self._msgs[i].msg_len], _decode_sockaddr(self._names[i].raw))
+                for i in range(n)]
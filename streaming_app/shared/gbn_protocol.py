@@ -1,15 +1,213 @@
+import os
+import sys
+import array
+import ctypes
+import collections
+import queue
 import socket
 import struct
 import time
 import logging
-from threading import Timer
+from threading import Condition, Lock, Thread
 from typing import Optional
 
+import numpy as np
+
+from shared import batch_io
+
 # -- Protocol Constants --
 SEQ_NUM_MODULO = 65536  # 2^16
 HEADER_FORMAT = '!H H'  # Seq Num (16-bit), Checksum (16-bit)
-HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+_GBN_HDR = struct.Struct(HEADER_FORMAT)
+HEADER_SIZE = _GBN_HDR.size
+# Client-to-server datagrams start with a one-byte type tag
+MSG_TAG_ACK = 0x00  # followed by the GBN header of the ACK
+MSG_TAG_CMD = 0x01  # followed by a UTF-8 text command, e.g. "PLAY file.mp4"
+_TAGGED_ACK = struct.Struct('!B' + HEADER_FORMAT[1:])
 TIMEOUT_INTERVAL = 0.5  # Seconds
+MAX_STALLED_TIMEOUTS = 20  # consecutive timeouts with no ACK progress before the sender gives up
+RECV_POOL_SIZE = 64  # receive buffers GBNReceiver.recv() cycles through without recvmmsg; > RECV_MMSG_BATCH
+RECV_MMSG_BATCH = 32  # datagrams GBNReceiver.recv() drains per wake-up
+_MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)  # 0 where unsupported (Windows): no draining
+TINY_CHECKSUM_BYTES = 128  # Below this array.array + sum() beats both numpy and the numba call overhead
+SMALL_CHECKSUM_BYTES = 4096  # Below this numpy's per-call setup cost outweighs the vectorized sum
+
+# -- Optional JIT Checksum --
+
+try:
+    from numba import njit, types as nb_types
+except ImportError:
+    njit = None
+
+if njit is not None:
+    _U8_ARRAY = nb_types.Array(nb_types.uint8, 1, 'C')
+    _U8_ARRAY_RO = nb_types.Array(nb_types.uint8, 1, 'C', readonly=True)
+
+    # Explicit signatures compile at import, so the first packet never pays the JIT cost
+    @njit([nb_types.uint16(_U8_ARRAY), nb_types.uint16(_U8_ARRAY_RO)], cache=True, boundscheck=False)
+    def _checksum_jit(buf):
+        n = buf.shape[0]
+        checksum = 0
+        for i in range(0, n - 1, 2):
+            checksum += (buf[i] << 8) | buf[i + 1]
+        if n & 1:
+            checksum += buf[n - 1] << 8
+        while checksum >> 16:
+            checksum = (checksum & 0xFFFF) + (checksum >> 16)
+        return ~checksum & 0xFFFF
+
+    def _make_csum(n: int):
+        """
+        Compiles a checksum for buffers of exactly `n` bytes. With the length a
+        compile-time constant LLVM can unroll and vectorize the word loop.
+        """
+        odd = n & 1
+
+        @njit([nb_types.uint16(_U8_ARRAY), nb_types.uint16(_U8_ARRAY_RO)], cache=True, boundscheck=False)
+        def checksum_fixed(buf):
+            checksum = 0
+            for i in range(0, n - 1, 2):
+                checksum += (buf[i] << 8) | buf[i + 1]
+            if odd:
+                checksum += buf[n - 1] << 8
+            while checksum >> 16:
+                checksum = (checksum & 0xFFFF) + (checksum >> 16)
+            return ~checksum & 0xFFFF
+        return checksum_fixed
+else:
+    _checksum_jit = None
+    _make_csum = None
+
+
+class _FixedSizeChecksum:
+    """
+    Video chunks are all the same size except the last one of each frame. Sizes
+    registered with expect() get a checksum specialized to them, compiled on a
+    background thread (a cache hit after the first run) when lookup() first sees
+    that size. Until it is ready, and for any other length, lookup() returns None
+    and the caller takes the general path: nothing is compiled on the packet path.
+    """
+
+    def __init__(self):
+        self._expected = set()  # registered sizes whose compile has not started
+        self._compiled = {}
+
+    def expect(self, n: int):
+        if n not in self._compiled:
+            self._expected.add(n)
+
+    def _compile(self, n: int):
+        self._compiled[n] = _make_csum(n)
+
+    def lookup(self, n: int):
+        csum = self._compiled.get(n)
+        if csum is None and n in self._expected:
+            try:
+                self._expected.remove(n)  # only the first caller starts the compile
+            except KeyError:
+                return None
+            Thread(target=self._compile, args=(n,), name="gbn-checksum-jit", daemon=True).start()
+        return csum
+
+_fixed_checksum = _FixedSizeChecksum() if _make_csum is not None else None
+
+# -- Optional Native Checksum --
+
+def _cpu_flags() -> set:
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    return set(line.split(':', 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+def _load_native_lib():
+    """Load _gbn_csum.so (built from _gbn_csum.c) if it sits next to this file."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '_gbn_csum.so')
+    try:
+        # CDLL (not PyDLL) drops the GIL for the duration of each call, so checksums on the
+        # receive thread run alongside cv2.imdecode on the client's decode pool. The extension
+        # build does the same for buffers of NOGIL_MIN_BYTES (1 KiB) or more, i.e. data datagrams.
+        return ctypes.CDLL(path)
+    except OSError:
+        return None
+
+def _load_native_checksum(lib):
+    """Pick the fastest inet_csum_* kernel in lib for this CPU."""
+    if lib is None:
+        return None
+    flags = _cpu_flags()
+    # Picked once here so the per-packet call is a single indirection with no feature test
+    for flag, name in (('avx512bw', 'inet_csum_avx512'),
+                       ('avx2', 'inet_csum_avx2'),
+                       ('sse2', 'inet_csum_sse2'),
+                       (None, 'inet_csum_scalar')):
+        if flag is not None and flag not in flags:
+            continue
+        fn = getattr(lib, name, None)
+        if fn is None:
+            continue
+        fn.argtypes = (ctypes.c_void_p, ctypes.c_size_t)
+        fn.restype = ctypes.c_uint16
+        return fn
+    return None
+
+def _load_native_checksum2(lib):
+    fn = getattr(lib, 'inet_csum2', None) if lib is not None else None
+    if fn is not None:
+        fn.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p, ctypes.c_size_t)
+        fn.restype = ctypes.c_uint16
+    return fn
+
+def _load_native_ext():
+    """The CPython extension build of _gbn_csum.c, if present; it avoids ctypes' per-call overhead."""
+    try:
+        from shared import _gbn_csum_ext
+    except ImportError:
+        return None
+    return _gbn_csum_ext
+
+_native_ext = _load_native_ext()
+_native_lib = _load_native_lib()
+_inet_csum = _load_native_checksum(_native_lib)
+_inet_csum2 = _load_native_checksum2(_native_lib)
+
+if _native_ext is not None or _inet_csum is not None:
+    # a native kernel always runs first, so the specialized checksums would never be used
+    _fixed_checksum = None
+
+def expect_checksum_size(n: int):
+    """
+    Hint that many buffers of exactly n bytes will be checksummed (e.g. RTPStreamer's
+    chunk payload and the GBN datagram carrying it), so a checksum specialized to n is
+    worth compiling. A no-op when a native checksum is loaded or numba is missing.
+    """
+    if _fixed_checksum is not None:
+        _fixed_checksum.expect(n)
+
+def _buffer_address(data):
+    """Address argument for a c_void_p parameter. The caller keeps `data` referenced across the call."""
+    if type(data) is bytes:
+        return data
+    # c_void_p only borrows bytes directly; other buffers go through numpy for the address
+    return np.frombuffer(data, dtype=np.uint8).ctypes.data
+
+def _checksum_array(data) -> int:
+    """Checksum via array.array('H') and the builtin sum(), for buffers of a few words."""
+    n = len(data)
+    words = array.array('H')
+    words.frombytes(memoryview(data)[:n & ~1])
+    if sys.byteorder == 'little':
+        words.byteswap()
+    checksum = sum(words)
+    # Odd trailing byte is padded with a zero low byte
+    if n & 1:
+        checksum += data[-1] << 8
+    while checksum >> 16:
+        checksum = (checksum & 0xFFFF) + (checksum >> 16)
+    return ~checksum & 0xFFFF
 
 # -- Helper Classes --
 
@@ -20,32 +218,96 @@ class LossModel:
 
 class GBNUtilities:
     @staticmethod
-    def compute_checksum(data: bytes) -> int:
-        checksum = 0
-        for i in range(0, len(data), 2):
-            section = data[i] << 8
-            if i + 1 < len(data):
-                section += data[i+1]
-            checksum += section
+    def compute_checksum(data: bytes, seq_num: int = None) -> int:
+        """
+        Internet checksum of data. With seq_num it is the checksum of the seq word followed
+        by data, as on the wire, without building that concatenation.
+        """
+        if seq_num is not None:
+            return GBNUtilities.update_checksum(GBNUtilities.compute_checksum(data), 0, seq_num)
+        if _native_ext is not None:
+            return _native_ext.checksum(data)
+        n = len(data)
+        if _inet_csum is not None:
+            if type(data) is bytes:
+                return _inet_csum(data, n)
+            return _inet_csum(_buffer_address(data), n)
+        if _fixed_checksum is not None:
+            csum_fixed = _fixed_checksum.lookup(n)
+            if csum_fixed is not None:
+                return int(csum_fixed(np.frombuffer(data, dtype=np.uint8)))
+        if n < TINY_CHECKSUM_BYTES:
+            return _checksum_array(data)
+        if n < SMALL_CHECKSUM_BYTES and _checksum_jit is not None:
+            return int(_checksum_jit(np.frombuffer(data, dtype=np.uint8)))
+        return GBNUtilities.compute_checksum_np(data)
+
+    @staticmethod
+    def compute_checksum_np(data: bytes) -> int:
+        """Vectorized checksum of a large buffer: one numpy reduction over its 16-bit words."""
+        n = len(data)
+        # Sum the even-length prefix as big-endian 16-bit words in one numpy call
+        words = np.frombuffer(data, dtype='>u2', count=n >> 1)
+        checksum = int(words.sum(dtype=np.uint64))
+        # Odd trailing byte is padded with a zero low byte
+        if n & 1:
+            checksum += data[-1] << 8
+        while checksum >> 16:
             checksum = (checksum & 0xFFFF) + (checksum >> 16)
         return ~checksum & 0xFFFF
 
+    @staticmethod
+    def compute_checksum2(head: bytes, payload: bytes) -> int:
+        """Checksum of head + payload without building the concatenation."""
+        if _native_ext is not None:
+            return _native_ext.checksum2(head, payload)
+        if _inet_csum2 is not None:
+            return _inet_csum2(_buffer_address(head), len(head), _buffer_address(payload), len(payload))
+        return GBNUtilities.compute_checksum_parts((head, payload))
+
+    @staticmethod
+    def compute_checksum_parts(parts) -> int:
+        """Checksum of the concatenation of any number of buffers, without building it."""
+        total = 0
+        odd = 0
+        for part in parts:
+            part_sum = ~GBNUtilities.compute_checksum(part) & 0xFFFF
+            if odd:
+                # a part starting at an odd offset has its bytes in the other word halves
+                part_sum = ((part_sum << 8) | (part_sum >> 8)) & 0xFFFF
+            total += part_sum
+            odd ^= len(part) & 1
+        while total >> 16:
+            total = (total & 0xFFFF) + (total >> 16)
+        return ~total & 0xFFFF
+
+    @staticmethod
+    def update_checksum(checksum: int, old_word: int, new_word: int) -> int:
+        """
+        RFC 1624 incremental update: the checksum after one covered 16-bit word
+        changes from old_word to new_word. Exact when old_word is 0, i.e. when
+        adding a word to a checksum that did not cover it.
+        """
+        total = (~checksum & 0xFFFF) + new_word
+        if old_word:
+            total += ~old_word & 0xFFFF
+        total = (total & 0xFFFF) + (total >> 16)
+        total = (total & 0xFFFF) + (total >> 16)
+        return ~total & 0xFFFF
+
     @staticmethod
     def serialize_packet(seq_num: int, checksum: int, payload: bytes) -> bytes:
-        header = struct.pack(HEADER_FORMAT, seq_num, checksum)
-        return header + payload
+        return _GBN_HDR.pack(seq_num, checksum) + payload
 
     @staticmethod
     def deserialize_packet(data: bytes):
+        """(seq_num, checksum, payload); payload is a memoryview into data, not a copy."""
         if len(data) < HEADER_SIZE:
             return None
-        header = data[:HEADER_SIZE]
-        payload = data[HEADER_SIZE:]
-        try:
-            seq_num, checksum = struct.unpack(HEADER_FORMAT, header)
-            return seq_num, checksum, payload
-        except struct.error:
-            return None
+        seq_num, checksum = _GBN_HDR.unpack_from(data, 0)
+        if type(data) is not memoryview:
+            data = memoryview(data)
+        return seq_num, checksum, data[HEADER_SIZE:]
 
     @staticmethod
     def parse_header(data: bytes):
@@ -54,109 +316,355 @@ class GBNUtilities:
 
 # -- Sender Class --
 
+class _ProducerState:
+    """GBNSender fields written only by the sending thread (send_data / send_batch)."""
+    __slots__ = ('next_seq_num',)
+
+    def __init__(self):
+        self.next_seq_num = 0
+
+class _ConsumerState:
+    """GBNSender fields written only by the ACK-processing thread."""
+    __slots__ = ('send_base',)
+
+    def __init__(self):
+        self.send_base = 0
+
+_REACTOR_WAKE = object()  # queued to wake a sender's reactor thread that waits with no deadline
+
 class GBNSender:
-    def __init__(self, sock, receiver_addr=None, loss_model=None):
+    def __init__(self, sock, receiver_addr=None, loss_model=None, window_size=5, zerocopy=False):
         self.sock = sock
         self.receiver_addr = receiver_addr
-        self.send_base = 0
-        self.next_seq_num = 0
-        self.window_size = 5
-        self.unacked_buffer = {}
-        self.timer = None
+        # Producer and consumer halves live in separate objects, so a future free-threaded
+        # or native version of this class does not bounce one cache line between the threads
+        self._prod = _ProducerState()
+        self._cons = _ConsumerState()
+        self.window_size = window_size
+        # Unacked packets live in a ring indexed by seq & _win_mask. The ring is the window
+        # rounded up to a power of two, which divides SEQ_NUM_MODULO, so the index stays
+        # consistent across sequence wraparound. Slots send_base .. next_seq_num-1 are live.
+        ring_size = 1 << (window_size - 1).bit_length()
+        self._win = [None] * ring_size
+        self._win_mask = ring_size - 1
+        # One long-lived reactor thread applies posted ACKs and fires retransmission
+        # timeouts. The timer is just a monotonic deadline (None when stopped), so
+        # starting/stopping it per ACK costs an attribute store instead of a Timer thread.
+        self._deadline = None
+        self._events = queue.SimpleQueue()  # ACK numbers from post_ack(), or _REACTOR_WAKE
+        self._timer_parked = False  # reactor is waiting with no deadline and must be woken
+        self._closed = False
+        self._stalled = 0  # timeouts since the window last slid
         self.loss_model = loss_model or LossModel()
+        # Guards the window state; senders wait on _window_open while window_size packets are in flight
+        self._lock = Lock()
+        self._window_open = Condition(self._lock)
+        # zerocopy: sends pin the packet buffers instead of copying them (see batch_io.BatchSender);
+        # packets are immutable and kept in the ring until ACKed, so that is safe here
+        self._batch = batch_io.BatchSender(sock, zerocopy=zerocopy) if batch_io.SEND_AVAILABLE else None
+        self._zerocopy = self._batch is not None and self._batch.zerocopy
+        self._reactor = Thread(target=self._reactor_loop, daemon=True)
+        self._reactor.start()
+
+        # Metrics are plain counters on the sender; get_metrics() builds the dict on demand
+        self.packets_sent = 0
+        self.packets_delivered = 0
+        self.packets_lost = 0
+        self.retransmissions = 0
+        self.timeouts = 0
+        self.start_time = time.time()
+
+    @property
+    def send_base(self) -> int:
+        return self._cons.send_base
+
+    @property
+    def next_seq_num(self) -> int:
+        return self._prod.next_seq_num
+
+    def _in_flight(self) -> int:
+        return (self._prod.next_seq_num - self._cons.send_base) % SEQ_NUM_MODULO
+
+    def _window_has_room(self) -> bool:
+        return self._in_flight() < self.window_size
+
+    def _is_unacked(self, seq_num: int) -> bool:
+        return (seq_num - self._cons.send_base) % SEQ_NUM_MODULO < self._in_flight()
+
+    def _unacked_packets(self) -> list:
+        """Live packets, oldest first, as at most two contiguous slices of the ring. Caller holds _lock."""
+        win, start, count = self._win, self._cons.send_base & self._win_mask, self._in_flight()
+        end = start + count
+        if end <= len(win):
+            return win[start:end]
+        return win[start:] + win[:end - len(win)]
+
+    def _release(self, count: int):
+        """Drop the oldest count packets from the ring, slice-wise like _unacked_packets(). Caller holds _lock."""
+        win, start = self._win, self._cons.send_base & self._win_mask
+        end = start + count
+        if end <= len(win):
+            win[start:end] = [None] * count
+        else:
+            win[start:] = [None] * (len(win) - start)
+            win[:end - len(win)] = [None] * (end - len(win))
+
+    def _buffer_packet(self, data):
+        """
+        Build the packet for next_seq_num, keep it for retransmission and advance. Caller holds _lock.
+        A tuple payload is kept as a tuple of buffers (GBN header first) and gathered by the
+        kernel on every send, so its buffers must not change until the packet is ACKed.
+        """
+        if type(data) is tuple and len(data) >= batch_io.MAX_IOV:
+            # with the header, a sendmmsg() datagram holds at most MAX_IOV buffers: join the rest
+            keep = batch_io.MAX_IOV - 2
+            data = data[:keep] + (b''.join(data[keep:]),)
+        # 1. Checksum includes SeqNum + Payload to match Receiver logic.
+        # The seq word is folded into the payload checksum rather than concatenated onto a copy.
+        seq_num = self._prod.next_seq_num
+        if type(data) is tuple:
+            if len(data) == 2:
+                checksum = GBNUtilities.compute_checksum2(data[0], data[1])
+            else:
+                checksum = GBNUtilities.compute_checksum_parts(data)
+            checksum = GBNUtilities.update_checksum(checksum, 0, seq_num)
+            packet = (_GBN_HDR.pack(seq_num, checksum),) + data
+        else:
+            checksum = GBNUtilities.compute_checksum(data, seq_num)
+            packet = GBNUtilities.serialize_packet(seq_num, checksum, data)
+        self._win[seq_num & self._win_mask] = packet
+        self.packets_sent += 1
 
-        self.metrics = {
-            "packets_sent": 0,
-            "packets_delivered": 0,
-            "packets_lost": 0,
-            "retransmissions": 0,
-            "timeouts": 0,
-            "bytes_sent": 0,
-            "start_time": time.time()
-        }
+        if self._cons.send_base == seq_num:
+            self.start_timer()
 
-    def send_data(self, data):
-        # 1. Checksum includes SeqNum + Payload to match Receiver logic
-        seq_bytes = struct.pack('!H', self.next_seq_num)
-        checksum = GBNUtilities.compute_checksum(seq_bytes + data)
-        packet = GBNUtilities.serialize_packet(self.next_seq_num, checksum, data)
-        self.unacked_buffer[self.next_seq_num] = packet
-        self.metrics["packets_sent"] += 1
-
-        if self.loss_model.allow_packet():
-            self.sock.sendto(packet, self.receiver_addr)
+        self._prod.next_seq_num = (seq_num + 1) % SEQ_NUM_MODULO
+        return packet
+
+    def _send_packet(self, packet, addr):
+        if self._zerocopy:
+            self._batch.send((packet,), addr)
         else:
-            print(f'[GBN] Loss simulated. Dropped seq={self.next_seq_num}')
+            # scatter-gather: header and payload buffers go out as one datagram without joining
+            batch_io.send_one(self.sock, packet, addr)
 
-        if self.send_base == self.next_seq_num:
-            self.start_timer()
+    def _wait_for_room(self):
+        """Block until the window has room; ConnectionError once the sender is closed. Caller holds _lock."""
+        self._window_open.wait_for(lambda: self._closed or self._window_has_room())
+        if self._closed:
+            raise ConnectionError("GBN sender is closed")
 
-        self.next_seq_num = (self.next_seq_num + 1) % SEQ_NUM_MODULO
+    def send_data(self, data):
+        with self._window_open:
+            self._wait_for_room()
+            seq_num = self._prod.next_seq_num
+            packet = self._buffer_packet(data)
+            if self.loss_model.allow_packet():
+                self._send_packet(packet, self.receiver_addr)
+            else:
+                print(f'[GBN] Loss simulated. Dropped seq={seq_num}')
         return True
 
-    def receive_ack(self, ack_num):
-        self.stop_timer()
-        if ack_num in self.unacked_buffer:
-            # Remove all packets up to and including ack_num
-            to_remove = []
-            for seq in sorted(self.unacked_buffer.keys()):
-                to_remove.append(seq)
-                if seq == ack_num:
-                    break
-            for seq in to_remove:
-                del self.unacked_buffer[seq]
-                self.metrics["packets_delivered"] += 1
+    def send_iov(self, parts, addr=None):
+        """
+        Send one payload made of several buffers (e.g. an RTP header and a memoryview
+        of the chunk) without concatenating them. The buffers are retained for
+        retransmission, so they must not be modified afterwards. Beyond
+        batch_io.MAX_IOV - 1 buffers the trailing ones are joined into one.
+        """
+        with self._window_open:
+            self._wait_for_room()
+            seq_num = self._prod.next_seq_num
+            packet = self._buffer_packet(tuple(parts))
+            if self.loss_model.allow_packet():
+                self._send_packet(packet, addr or self.receiver_addr)
+            else:
+                print(f'[GBN] Loss simulated. Dropped seq={seq_num}')
+        return True
 
-            # Update send_base (simplification: base follows the cleared buffer)
-            if not self.unacked_buffer:
-                self.send_base = self.next_seq_num
+    def send_batch(self, payloads, addr=None):
+        """
+        Send several payloads in order. Each round takes as many as the window has room
+        for and puts them on the wire with a single sendmmsg() call where available.
+        Payloads may be tuples of buffers, as in send_iov().
+        """
+        addr = addr or self.receiver_addr
+        i = 0
+        while i < len(payloads):
+            with self._window_open:
+                self._wait_for_room()
+                room = self.window_size - self._in_flight()
+                wire = []
+                for data in payloads[i:i + room]:
+                    seq_num = self._prod.next_seq_num
+                    packet = self._buffer_packet(data)
+                    if self.loss_model.allow_packet():
+                        wire.append(packet)
+                    else:
+                        print(f'[GBN] Loss simulated. Dropped seq={seq_num}')
+                i += room
+                if self._batch is not None:
+                    self._batch.send(wire, addr)
+                else:
+                    for packet in wire:
+                        self._send_packet(packet, addr)
+        return True
 
-        if self.unacked_buffer:
-            self.start_timer()
+    def receive_ack(self, ack_num):
+        with self._window_open:
+            if not self._is_unacked(ack_num):
+                # Duplicate or stale ACK: nothing to slide, and the timer keeps running so
+                # repeated ACKs for the last good packet cannot postpone the retransmission
+                return
+            # Release all packets up to and including ack_num
+            acked = (ack_num - self._cons.send_base) % SEQ_NUM_MODULO + 1
+            self._release(acked)
+            self.packets_delivered += acked
+
+            # Cumulative ACK: the window now starts right after ack_num
+            self._cons.send_base = (ack_num + 1) % SEQ_NUM_MODULO
+            self._stalled = 0
+            self._window_open.notify_all()
+
+            self.stop_timer()
+            if self._in_flight():
+                self.start_timer()
+
+    def _reactor_loop(self):
+        """
+        The sender's event loop: one thread applies ACKs from post_ack() and fires the
+        retransmission timeout, so ACK handling never races a timer thread.
+        """
+        try:
+            self._run_reactor()
+        except Exception as e:
+            # without the reactor no ACK is applied and the window never reopens, so close
+            # the sender: blocked sends get a ConnectionError instead of hanging
+            print(f"[GBN] Reactor failed: {e!r}; closing sender")
+            with self._window_open:
+                self._shutdown_locked()
+
+    def _run_reactor(self):
+        events = self._events
+        while not self._closed:
+            # Mark parked before reading the deadline so a start_timer() in between is not missed
+            self._timer_parked = True
+            deadline = self._deadline
+            timeout = None
+            if deadline is not None:
+                self._timer_parked = False
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    self.handle_timeout()
+                    continue
+            try:
+                # A deadline moved later by an ACK is picked up when this wait expires
+                ack_num = events.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            self._timer_parked = False
+            if ack_num is not _REACTOR_WAKE:
+                self._apply_acks(ack_num)
+
+    def _apply_acks(self, ack_num: int):
+        """Apply ack_num and every ACK queued behind it as one cumulative ACK: the newest in the window."""
+        base, best = self._cons.send_base, -1
+        get = self._events.get_nowait
+        while ack_num is not None:
+            if ack_num is not _REACTOR_WAKE and self._is_unacked(ack_num) and \
+                    (best < 0 or (ack_num - base) % SEQ_NUM_MODULO > (best - base) % SEQ_NUM_MODULO):
+                best = ack_num
+            try:
+                ack_num = get()
+            except queue.Empty:
+                ack_num = None
+        if best >= 0:
+            self.process_ack(best)
+
+    def post_ack(self, ack_num: int):
+        """Hand an ACK to the reactor thread; returns at once. process_ack() is the synchronous form."""
+        self._events.put(ack_num)
 
     def start_timer(self):
-        if self.timer is None:
-            self.timer = Timer(TIMEOUT_INTERVAL, self.handle_timeout)
-            self.timer.start()
+        if self._deadline is None:
+            self._deadline = time.monotonic() + TIMEOUT_INTERVAL
+            if self._timer_parked:
+                self._events.put(_REACTOR_WAKE)
 
     def stop_timer(self):
-        if self.timer is not None:
-            self.timer.cancel()
-            self.timer = None
+        self._deadline = None
 
     def restart_timer(self):
         self.stop_timer()
         self.start_timer()
 
     def handle_timeout(self):
-        print("Timeout triggered!")
-        self.metrics["timeouts"] += 1
-        self.metrics["retransmissions"] += 1
-        for seq in sorted(self.unacked_buffer.keys()):
-            packet = self.unacked_buffer[seq]
-            self.metrics["packets_sent"] += 1
-            if self.loss_model.allow_packet():
-                self.sock.sendto(packet, self.receiver_addr)
-            else:
-                self.metrics["packets_lost"] += 1
+        with self._lock:
+            if self._deadline is None or time.monotonic() < self._deadline:
+                # an ACK stopped or restarted the timer while this thread was waiting for the lock
+                return
+            self._stalled += 1
+            if self._stalled > MAX_STALLED_TIMEOUTS:
+                # the receiver has stopped ACKing; release anyone blocked on the window
+                print(f"[GBN] No ACK progress after {MAX_STALLED_TIMEOUTS} timeouts; closing sender")
+                self._shutdown_locked()
+                return
+            print("Timeout triggered!")
+            self.timeouts += 1
+            self.retransmissions += 1
+            unacked = self._unacked_packets()
+            allow_packet = self.loss_model.allow_packet
+            wire = [packet for packet in unacked if allow_packet()]
+            self.packets_sent += len(unacked)
+            self.packets_lost += len(unacked) - len(wire)
+            # the whole window goes back out in one sendmmsg() where available
+            try:
+                if self._batch is not None:
+                    self._batch.send(wire, self.receiver_addr)
+                else:
+                    for packet in wire:
+                        self._send_packet(packet, self.receiver_addr)
+            except OSError as e:
+                # counts as a lost round: retried on the next timeout, and a send that keeps
+                # failing ends in the stalled-timeout close above
+                print(f"[GBN] Retransmission failed: {e}")
+
+            self.restart_timer()
+
+    def wait_until_acked(self):
+        """Block until every packet sent so far is ACKed, or the sender is closed."""
+        with self._window_open:
+            self._window_open.wait_for(lambda: self._closed or not self._in_flight())
+
+    def _shutdown_locked(self):
+        self._closed = True
+        self._deadline = None
+        self._window_open.notify_all()
+        self._events.put(_REACTOR_WAKE)
 
-        self.restart_timer()
+    def close(self):
+        """
+        Stop the reactor thread and wake any sender blocked on the window. Unacked packets
+        are no longer retransmitted.
+        """
+        with self._window_open:
+            self._shutdown_locked()
 
     def get_metrics(self):
         now = time.time()
-        elapsed = now - self.metrics["start_time"]
+        elapsed = now - self.start_time
         return {
-            "packets_sent": self.metrics["packets_sent"],
-            "packets_delivered": self.metrics["packets_delivered"],
-            "packets_lost": self.metrics["packets_lost"],
-            "retransmissions": self.metrics["retransmissions"],
-            "timeouts": self.metrics["timeouts"],
+            "packets_sent": self.packets_sent,
+            "packets_delivered": self.packets_delivered,
+            "packets_lost": self.packets_lost,
+            "retransmissions": self.retransmissions,
+            "timeouts": self.timeouts,
             "elapsed_time_sec": elapsed
         }
 
     def process_ack(self, ack_num: int):
         # Ignore ACKs not inside the window
-        if ack_num not in self.unacked_buffer:
+        if not self._is_unacked(ack_num):
             return
         self.receive_ack(ack_num)
 
@@ -166,22 +674,29 @@ logger = logging.getLogger("GBNReceiver")
 logging.basicConfig(level=logging.INFO)
 
 class GBNReceiver:
-    def __init__(self, sock: socket.socket, peer: tuple = None, recv_buf_size: int = 65536, timeout: float = None):
+    def __init__(self, sock: socket.socket, peer: tuple = None, recv_buf_size: int = 2048, timeout: float = None):
         self.sock = sock
         self.peer = peer
-        self.recv_buf_size = recv_buf_size
+        self.recv_buf_size = recv_buf_size  # per-datagram buffer; GBN packets fit in one MTU
         self._closed = False
         self.expected = 0
+        # ACK for expected - 1, re-sent as-is for every out-of-order or duplicate packet.
+        # Rewritten in place by _set_ack() rather than re-allocated per in-order packet;
+        # sendto() copies it into the kernel, so reusing the buffer is safe.
+        self._ack_buf = bytearray(_TAGGED_ACK.size)
+        self._set_ack(SEQ_NUM_MODULO - 1)
+        # recv() reads into these in rotation instead of allocating a bytes object per datagram
+        self._recv_pool = collections.deque(bytearray(recv_buf_size) for _ in range(RECV_POOL_SIZE))
+        self._batch = None
+        # in-order payloads recv() has already received and ACKed but not yet returned
+        self._pending = collections.deque()
+        self._recv_batcher = None
         if timeout is not None:
             self.sock.settimeout(timeout)
 
-    def _compute_check(self, seq_num: int, payload: bytes) -> int:
-        seq_bytes = struct.pack('!H', seq_num)
-        return GBNUtilities.compute_checksum(seq_bytes + payload)
-
-    def _pack_ack(self, ack_num: int) -> bytes:
-        chk = GBNUtilities.compute_checksum(struct.pack('!H', ack_num))
-        return struct.pack(HEADER_FORMAT, ack_num, chk)
+    def _set_ack(self, ack_num: int):
+        # The checksum of the single word ack_num is just its complement
+        _TAGGED_ACK.pack_into(self._ack_buf, 0, MSG_TAG_ACK, ack_num, ~ack_num & 0xFFFF)
 
     def send(self, data: bytes):
         if self.peer:
@@ -189,43 +704,134 @@ class GBNReceiver:
         else:
             self.sock.send(data)
 
+    def _handle_datagrams(self, datagrams, out):
+        """
+        Verify and ACK a batch of (raw, addr) datagrams, appending in-order payloads to out.
+        Out-of-order and duplicate packets re-send the ACK for the last good packet; short
+        or corrupt ones are dropped. The per-datagram names are bound to locals once per
+        batch, and `expected` is kept in a local and written back when the batch is done.
+        """
+        if not datagrams:
+            return
+        if not self.peer:
+            self.peer = datagrams[0][1]
+        peer, sendto = self.peer, self.sock.sendto
+        checksum, unpack_from = GBNUtilities.compute_checksum, _GBN_HDR.unpack_from
+        ack_buf, pack_ack = self._ack_buf, _TAGGED_ACK.pack_into
+        append, header_size, modulo = out.append, HEADER_SIZE, SEQ_NUM_MODULO
+        expected = self.expected
+        try:
+            for raw, _ in datagrams:
+                # Verify checksum over the whole datagram with the on-wire checksum in place:
+                # Seq + Checksum + Payload sums to 0xFFFF, so the checksum is 0 when intact
+                if len(raw) < header_size or checksum(raw) != 0:
+                    continue
+                pkt_seq = unpack_from(raw)[0]
+                if pkt_seq == expected:
+                    pack_ack(ack_buf, 0, MSG_TAG_ACK, pkt_seq, ~pkt_seq & 0xFFFF)
+                    sendto(ack_buf, peer)
+                    expected = (expected + 1) % modulo
+                    append(raw[header_size:])
+                else:
+                    # Out of order - Re-ACK last good packet
+                    sendto(ack_buf, peer)
+        finally:
+            self.expected = expected
+
     def recv(self) -> Optional[bytes]:
+        """
+        Blocks until the next in-order payload arrives. The payload is a memoryview into a
+        reused buffer and stays valid until the next recv() call.
+        """
+        pending = self._pending
+        if pending:
+            return pending.popleft()
+        if not batch_io.AVAILABLE:
+            return self._recv_drain()
+        if self._recv_batcher is None:
+            self._recv_batcher = batch_io.BatchReceiver(self.sock, RECV_MMSG_BATCH, self.recv_buf_size)
         while not self._closed:
             try:
-                raw, addr = self.sock.recvfrom(self.recv_buf_size)
-            except socket.timeout:
-                continue
+                datagrams = self._recv_batcher.recv()
             except Exception:
                 return None
+            # ACK the whole batch now; its payloads are handed out one call at a time
+            self._handle_datagrams(datagrams, pending)
+            if pending:
+                return pending.popleft()
 
-            if not self.peer:
-                self.peer = addr
+        return None
 
-            parsed = GBNUtilities.deserialize_packet(raw)
-            if not parsed:
+    def _recv_drain(self) -> Optional[bytes]:
+        """
+        recv() without recvmmsg: block in recvfrom_into() for one datagram, then take every
+        datagram already queued (up to RECV_MMSG_BATCH) with MSG_DONTWAIT before handling
+        them. Datagrams land in the rotating buffer pool, so queued payloads stay valid.
+        """
+        pool, pending = self._recv_pool, self._pending
+        recvfrom_into = self.sock.recvfrom_into
+        # A socket with a timeout waits for it before every call, MSG_DONTWAIT or not,
+        # so only a blocking socket drains
+        drain = _MSG_DONTWAIT and self.sock.gettimeout() is None
+        while not self._closed:
+            buf = pool[0]
+            pool.rotate(-1)
+            try:
+                n, addr = recvfrom_into(buf)
+            except socket.timeout:
                 continue
+            except Exception:
+                return None
 
-            pkt_seq, pkt_checksum, payload = parsed
+            datagrams = [(memoryview(buf)[:n], addr)]
+            while drain and len(datagrams) < RECV_MMSG_BATCH:
+                buf = pool[0]
+                try:
+                    n, addr = recvfrom_into(buf, 0, _MSG_DONTWAIT)
+                except OSError:
+                    # BlockingIOError: the queue is empty; anything else surfaces on the next blocking call
+                    break
+                pool.rotate(-1)
+                datagrams.append((memoryview(buf)[:n], addr))
 
-            # Verify checksum (Seq + Payload)
-            calc = self._compute_check(pkt_seq, payload)
-            if calc != pkt_checksum:
-                # Corrupt
-                continue
+            self._handle_datagrams(datagrams, pending)
+            if pending:
+                return pending.popleft()
 
-            # GBN In-Order Check
-            if pkt_seq == self.expected:
-                # Good packet
-                ack_pkt = self._pack_ack(pkt_seq)
-                self.sock.sendto(ack_pkt, self.peer)
-                self.expected = (self.expected + 1) % SEQ_NUM_MODULO
-                return payload
-            else:
-                # Out of order - Re-ACK last good packet
-                ack_num = (self.expected - 1) % SEQ_NUM_MODULO
-                ack_pkt = self._pack_ack(ack_num)
-                self.sock.sendto(ack_pkt, self.peer)
+        return None
 
+    def recv_batch(self, max_packets: int = 32) -> Optional[list]:
+        """
+        Like recv(), but drains up to max_packets datagrams per recvmmsg syscall and
+        returns every in-order payload among them (possibly none). Payloads are
+        memoryviews into reused buffers, valid only until the next recv_batch() call.
+        Returns None once the socket is closed or fails.
+        """
+        if self._pending:
+            # left over from recv(); those views live in recv()'s own buffers
+            payloads = list(self._pending)
+            self._pending.clear()
+            return payloads
+        if not batch_io.AVAILABLE:
+            payload = self.recv()
+            if payload is None:
+                return None
+            # plus whatever else the same wake-up drained
+            payloads = [payload]
+            payloads.extend(self._pending)
+            self._pending.clear()
+            return payloads
+        if self._batch is None or self._batch.max_packets != max_packets:
+            self._batch = batch_io.BatchReceiver(self.sock, max_packets, self.recv_buf_size)
+        while not self._closed:
+            try:
+                datagrams = self._batch.recv()
+            except Exception:
+                return None
+            payloads = []
+            self._handle_datagrams(datagrams, payloads)
+            if payloads:
+                return payloads
         return None
 
     def close(self):
@@ -1,32 +1,71 @@
-import random as rd
-import time
-
-class LossModel:
-    def __init__(self,
-                 random_loss_rate = 0.0,
-                 burst_loss_rate = 0.0,
-                 burst_duration_ms = 0.0,
-                 burst_interval_ms = 0.0):
-        self.random_loss_rate = random_loss_rate
-        self.burst_loss_rate = burst_loss_rate
-        self.burst_duration_ms = burst_duration_ms
-        self.burst_interval_ms = burst_interval_ms
-
-    def allow_packet(self):
-        # 1. Burst Logic
-        if self.burst_loss_rate > 0:
-            now = int(time.time() * 1000)
-            # Avoid division by zero if interval is not set
-            if self.burst_interval_ms > 0:
-                pos = now % self.burst_interval_ms
-                
-                # If we are inside the "Danger Zone" (Duration)
-                if pos < self.burst_duration_ms:
-                    if rd.random() < self.burst_loss_rate:
-                        return False # DROP PACKET
-
-        # 2. Random Logic
-        if rd.random() < self.random_loss_rate:
-            return False # DROP PACKET
-
-        return True # SEND PACKET
\ No newline at end of file
+import itertools
+import random
+import time
+
+import numpy as np
+
+TRIAL_BLOCK = 65536  # loss decisions drawn per numpy call
+
+def _bernoulli_stream(loss_rate, rng):
+    """
+    Returns a callable yielding one send/drop decision (True = send) per call. Decisions
+    are drawn TRIAL_BLOCK at a time from the numpy Generator rng, so each call is just a
+    C-level next().
+    """
+    def blocks():
+        while True:
+            yield (rng.random(TRIAL_BLOCK) >= loss_rate).tolist()
+    return itertools.chain.from_iterable(blocks()).__next__
+
+class LossModel:
+    def __init__(self,
+                 random_loss_rate = 0.0,
+                 burst_loss_rate = 0.0,
+                 burst_duration_ms = 0.0,
+                 burst_interval_ms = 0.0,
+                 seed = None):
+        self.random_loss_rate = random_loss_rate
+        self.burst_loss_rate = burst_loss_rate
+        self.burst_duration_ms = burst_duration_ms
+        self.burst_interval_ms = burst_interval_ms
+        # Burst windows repeat every interval from construction; track the current one's
+        # start on the monotonic clock instead of taking the wall clock modulo the interval
+        self._interval_s = burst_interval_ms / 1000
+        self._duration_s = burst_duration_ms / 1000
+        self._burst_start = time.monotonic()
+        # Each model draws from its own generator, so senders do not share one stream. Without
+        # an explicit seed it is seeded from the random module, so random.seed() still
+        # reproduces a run.
+        self._rng = np.random.default_rng(random.getrandbits(64) if seed is None else seed)
+        self._random_allow = _bernoulli_stream(random_loss_rate, self._rng)
+        self._burst_allow = _bernoulli_stream(burst_loss_rate, self._rng)
+        # allow_packet() returns True to send the packet, False to drop it. Bind the cheapest
+        # variant for this profile, so per-packet calls carry no branches for loss types the
+        # profile does not use
+        bursty = burst_loss_rate > 0 and burst_interval_ms > 0
+        if not bursty and random_loss_rate <= 0:
+            # Lossless profile: skip the clock and the RNG on every packet
+            self.allow_packet = lambda: True
+        elif not bursty:
+            # Random loss only: each call is one pre-drawn decision
+            self.allow_packet = self._random_allow
+        elif random_loss_rate <= 0:
+            self.allow_packet = self._allow_burst
+        else:
+            self.allow_packet = self._allow_burst_and_random
+
+    def _burst_active(self) -> bool:
+        """True while the current burst window's "Danger Zone" (Duration) is open."""
+        now = time.monotonic()
+        elapsed = now - self._burst_start
+        if elapsed >= self._interval_s:
+            # Jump to the window that contains now
+            self._burst_start += self._interval_s * (elapsed // self._interval_s)
+            elapsed = now - self._burst_start
+        return elapsed < self._duration_s
+
+    def _allow_burst(self):
+        return not self._burst_active() or self._burst_allow()
+
+    def _allow_burst_and_random(self):
+        return (not self._burst_active() or self._burst_allow()) and self._random_allow()
@@ -0,0 +1,101 @@
+"""
+Bounded single-producer / single-consumer ring buffer.
+
+Exactly one thread calls put() and exactly one other thread calls get(). The
+producer only ever writes `_tail` and the consumer only ever writes `_head`,
+so neither side locks to move items: under the GIL an attribute store is atomic, and
+the producer stores the item in its slot before publishing the new `_tail`
+(the consumer likewise clears the slot before publishing `_head`), so each
+side only sees slots the other has finished with.
+
+put()/get() mirror queue.Queue: with a timeout they raise queue.Full /
+queue.Empty when it expires. A waiting side first spins, yielding the GIL,
+then parks on a Condition. It sets its `_*_parked` flag under the
+Condition's lock before re-checking the ring, and the other side notifies
+only when it sees that flag after publishing. So the lock is only taken
+once a side has actually gone to sleep, and no wake-up is lost.
+"""
+
+import queue
+import threading
+import time
+
+_SPIN_YIELDS = 64  # sleep(0) rounds before parking on the condition
+
+
+class SPSCRing:
+    def __init__(self, capacity: int = 8):
+        if capacity <= 0 or capacity & (capacity - 1):
+            raise ValueError("capacity must be a power of two")
+        self._slots = [None] * capacity
+        self._mask = capacity - 1
+        self._head = 0  # next slot to read; written by the consumer only
+        self._tail = 0  # next slot to write; written by the producer only
+        self._cond = threading.Condition()
+        self._producer_parked = False
+        self._consumer_parked = False
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def try_put(self, item) -> bool:
+        tail = self._tail
+        if tail - self._head > self._mask:
+            return False
+        self._slots[tail & self._mask] = item
+        self._tail = tail + 1
+        if self._consumer_parked:
+            with self._cond:
+                self._cond.notify()
+        return True
+
+    def put(self, item, timeout: float = None):
+        if self.try_put(item):
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        spins = 0
+        while not self.try_put(item):
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise queue.Full
+            if spins < _SPIN_YIELDS:
+                spins += 1
+                time.sleep(0)
+                continue
+            with self._cond:
+                self._producer_parked = True
+                if self._tail - self._head > self._mask:
+                    self._cond.wait(remaining)
+                self._producer_parked = False
+
+    def get(self, timeout: float = None):
+        head = self._head
+        deadline = None
+        spins = 0
+        while head == self._tail:
+            if deadline is None and timeout is not None:
+                deadline = time.monotonic() + timeout
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise queue.Empty
+            if spins < _SPIN_YIELDS:
+                spins += 1
+                time.sleep(0)
+                continue
+            with self._cond:
+                self._consumer_parked = True
+                if head == self._tail:
+                    self._cond.wait(remaining)
+                self._consumer_parked = False
+        slot = head & self._mask
+        item = self._slots[slot]
+        self._slots[slot] = None  # drop the reference before the producer may reuse the slot
+        self._head = head + 1
+        if self._producer_parked:
+            with self._cond:
+                self._cond.notify()
+        return item